@@ -8,6 +8,7 @@ http://madesigner.flightgear.org
 
 """
 
+import multiprocessing
 import os.path
 import sys
 from PyQt5.QtWidgets import QApplication
@@ -28,4 +29,7 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
+    # (the nesting can run worker processes, which in a frozen windows
+    # build would otherwise start the whole app again)
+    multiprocessing.freeze_support()
     main()
@@ -12,6 +12,7 @@ import fileinput
 import math
 import string
 import re
+import numpy as np
 import Polygon
 
 from pkg_resources import resource_stream
@@ -151,61 +152,23 @@ class Airfoil(Contour):
                 x = 0.0
             self.bottom.append( (x, y) )
 
-    def walk_curve_from_front(self, curve, xstart, target_dist):
-        #print "walk from " + str(xstart) + " dist of " + str(target_dist)
-        n = len(curve)
-        dist = 0
-        cur = ( xstart, self.simple_interp(curve, xstart) )
-        next_index = spline.binsearch(curve, xstart) + 1
-        if next_index < n:
-            dist_to_next = self.dist_2d(cur, curve[next_index])
-        else:
-            # ran out of points
-            return cur[0]
-        #print "idx = " + str(next_index) + " dist_to_next = " + str(dist_to_next)
-        while dist + dist_to_next < target_dist:
-            dist += dist_to_next
-            cur = curve[next_index]
-            next_index += 1
-            if next_index < n:
-                dist_to_next = self.dist_2d(cur, curve[next_index])
-            else:
-                # ran out of points
-                return cur[0]
-        rem = target_dist - dist
-        pct = rem / dist_to_next
-        dx = curve[next_index][0] - cur[0]
+    # the surface name ("top" or "bottom") of one of our curves
+    def curve_surf(self, curve):
+        if curve is self.top:
+            return "top"
+        if curve is self.bottom:
+            return "bottom"
+        raise ValueError("curve is neither the top nor the bottom surface")
 
-        return cur[0] + dx * pct
+    # the x position target_dist along a curve (self.top or
+    # self.bottom) walking back from xstart
+    def walk_curve_from_front(self, curve, xstart, target_dist):
+        return self.arc_xpos(self.curve_surf(curve), xstart, target_dist)
 
+    # the x position target_dist along a curve (self.top or
+    # self.bottom) walking forward from xend
     def walk_curve_from_back(self, curve, xend, target_dist):
-        print "walk from " + str(xend) + " dist of " + str(target_dist)
-        n = len(curve)
-        print "curve is " + str(n) + " points"
-        dist = 0
-        cur = ( xend, self.simple_interp(curve, xend) )
-        prior_index = spline.binsearch(curve, xend)
-        print "prior_index = " + str(prior_index)
-        if prior_index >= 0:
-            dist_to_prior = self.dist_2d(cur, curve[prior_index])
-        else:
-            # ran out of points
-            return cur[0]
-        print "idx = " + str(prior_index) + " dist_to_prior = " + str(dist_to_prior)
-        while dist + dist_to_prior < target_dist:
-            dist += dist_to_prior
-            cur = curve[prior_index]
-            prior_index -= 1
-            if prior_index >= 0:
-                dist_to_prior = self.dist_2d(cur, curve[prior_index])
-            else:
-                # ran out of points
-                return cur[0]
-        rem = target_dist - dist
-        pct = rem / dist_to_prior
-        dx = cur[0] - curve[prior_index][0]
-
-        return cur[0] - dx * pct
+        return self.arc_xpos(self.curve_surf(curve), xend, -target_dist)
 
     def cutout_leading_edge_diamond(self, size, pos=None, nudge=0.0):
         # make the Polygon representation of this part if needed
@@ -214,23 +177,41 @@ class Airfoil(Contour):
 
         target_diag = math.sqrt(2*size*size)
         # walk backwards equal amounts along both top and bottom curves until
-        # find the first points that are diag apart.
-        cur_diag = 0
+        # find the first points that are diag apart.  The distance is
+        # a whole number of steps, found by doubling and then
+        # bisecting on the number of steps (the diagonal grows as we
+        # move back from the nose.)
         step = 0.001
-        dist = step
         n = len(self.top)
         xstart = self.top[0][0]
         chord = self.top[n-1][0] - xstart
-        while cur_diag < target_diag and dist < chord:
+        def diagonal(k):
+            dist = k * step
             xtop = self.walk_curve_from_front(self.top, xstart, dist)
             ytop = self.simple_interp(self.top, xtop)
             xbottom = self.walk_curve_from_front(self.bottom, xstart, dist)
             ybottom = self.simple_interp(self.bottom, xbottom)
             cur_diag = self.dist_2d( (xtop, ytop), (xbottom, ybottom) )
-            dist += step
-        if dist >= chord:
-            print "unable to fit leading edge, stock diagonal longer than rib height?"
-            return []
+            return (cur_diag, xtop, ytop, xbottom, ybottom)
+        # the last step that leaves room on the chord
+        kmax = int(chord / step)
+        while kmax > 0 and (kmax + 1) * step >= chord:
+            kmax -= 1
+        lo = 0
+        hi = 1
+        while hi > kmax or diagonal(hi)[0] < target_diag:
+            if hi >= kmax:
+                print "unable to fit leading edge, stock diagonal longer than rib height?"
+                return []
+            lo = hi
+            hi = min(hi * 2, kmax)
+        while hi - lo > 1:
+            mid = (lo + hi) / 2
+            if diagonal(mid)[0] < target_diag:
+                lo = mid
+            else:
+                hi = mid
+        (cur_diag, xtop, ytop, xbottom, ybottom) = diagonal(hi)
         #print (xtop, ytop)
         #print (xbottom, ybottom)
         #print (cur_diag, target_diag)
@@ -253,7 +234,7 @@ class Airfoil(Contour):
         p4 = ( xtop-size*1.5, ytop )
         p5 = ( xbottom-size*1.5, ybottom )
         mask = Polygon.Polygon( (p1, p2, p3, p4, p5) )
-        self.poly = self.poly - mask
+        self.subtract(mask)
 
         # also make the true shape while we are here (reusing the
         # bottom of the cut mask)
@@ -269,6 +250,48 @@ class Airfoil(Contour):
         return shape
 
 
+    # the trailing edge stock attach point: the number of steps
+    # forward from the tail to the first x where the point (x, line(x))
+    # is more than dist from the tail point (or the last step before
+    # the nose.)  The distance grows as we move forward, so the step is
+    # found by doubling and then bisecting.
+    def fit_trailing_edge(self, line, dist, tail, xnose, step):
+        (xtail, ytail) = tail
+        def beyond(k):
+            x = xtail - k * step
+            return self.dist_2d( tail, (x, line(x)) ) > dist
+        kmax = int((xtail - xnose) / step)
+        while kmax > 1 and xtail - kmax * step < xnose:
+            kmax -= 1
+        lo = 0
+        hi = 1
+        while hi < kmax and not beyond(hi):
+            lo = hi
+            hi = min(hi * 2, kmax)
+        while hi - lo > 1:
+            mid = (lo + hi) / 2
+            if beyond(mid):
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+    # force fit reshaping of a curve to the trailing edge stock: shift
+    # each point by ycheat, scaled linearly from nothing at the nose
+    # (and at the tail) to the full amount at the cut point xpos, and
+    # insert the point (xpos, ycut) right at the cut so we can have a
+    # perfect fit
+    def ycheat_curve(self, curve, ycheat, xpos, xtail, ycut, step):
+        c = np.array(curve, dtype=float)
+        x = c[:,0]
+        offset = np.where( x <= xpos, ycheat * x / xpos,
+                           ycheat * (xtail - x) / (xtail - xpos) )
+        offset[x < 0.0] = 0.0
+        c[:,1] += offset
+        cut = np.nonzero( (x[:-1] < xpos-step) & (x[1:] > xpos+step) )[0]
+        c = np.insert(c, cut + 1, (xpos, ycut), axis=0)
+        return [ tuple(pt) for pt in c.tolist() ]
+
     def cutout_trailing_edge(self, width=0.0, height=0.0, shape="",
                              force_fit=False, pos=None, nudge=0.0):
         if shape == "Flat Triangle" or shape == "Symmetrical":
@@ -336,18 +359,16 @@ class Airfoil(Contour):
             return
 
         step = 0.001
-        xpos = xtail - step
-        cur_mid = step
-        # walk forward specified distances along top and bottom curves
-        # (starting at the back)
-        ytop = 0.0
-        ybottom = 0.0
-        while cur_mid <= mid_dist and xpos >= xnose:
-            ytop = self.simple_interp(self.top, xpos)
-            ybottom = self.simple_interp(self.bottom, xpos)
-            ymid = (ytop + ybottom) * 0.5
-            cur_mid = self.dist_2d( (xtail, ytail), (xpos, ymid) )
-            xpos -= step
+        # walk forward the specified distance along the mid line of
+        # the top and bottom curves (starting at the back)
+        def mid_line(x):
+            ytop = self.simple_interp(self.top, x)
+            ybottom = self.simple_interp(self.bottom, x)
+            return (ytop, ybottom, (ytop + ybottom) * 0.5)
+        k = self.fit_trailing_edge(lambda x: mid_line(x)[2], mid_dist,
+                                   (xtail, ytail), xnose, step)
+        (ytop, ybottom, ymid) = mid_line(xtail - k * step)
+        xpos = xtail - (k + 1) * step
 
         dx = xpos - xtail
         dy = ymid - ytail
@@ -367,45 +388,10 @@ class Airfoil(Contour):
             # airfoil vertical height at that point.)
             ycheat = 0.5 * (height*math.cos(angle) - (ytop - ybottom))
             #print "ycheat = " + str(ycheat) + " @ " + str(xpos)
-            newtop = []
-            newbottom = []
-            newpoly = Polygon.Polygon()
-            for i, pt in enumerate(self.top):
-                xcur = self.top[i][0]
-                ycur = self.top[i][1]
-                if i < len(self.top)-1:
-                    xnext = self.top[i+1][0]
-                else:
-                    xnext = None
-                if xcur < 0.0:
-                    offset = 0.0
-                elif xcur <= xpos:
-                    offset = ycheat * xcur / xpos
-                else:
-                    offset = ycheat * (xtail - xcur) / (xtail - xpos)
-                newtop.append( (xcur, ycur+offset) )
-                if xnext != None and xcur < xpos-step and xnext > xpos+step:
-                    # insert a point right at the cut so we can have a
-                    # perfect fit
-                    newtop.append( (xpos, ytop+ycheat) )
-            for i, pt in enumerate(self.bottom):
-                xcur = self.bottom[i][0]
-                ycur = self.bottom[i][1]
-                if i < len(self.bottom)-1:
-                    xnext = self.bottom[i+1][0]
-                else:
-                    xnext = None
-                if xcur < 0.0:
-                    offset = 0.0
-                elif xcur <= xpos:
-                    offset = ycheat * xcur / xpos
-                else:
-                    offset = ycheat * (xtail - xcur) / (xtail - xpos)
-                newbottom.append( (xcur, ycur-offset) )
-                if xnext != None and xcur < xpos-step and xnext > xpos+step:
-                    # insert a point right at the cut so we can have a
-                    # perfect fit
-                    newbottom.append( (xpos, ybottom-ycheat) )
+            newtop = self.ycheat_curve(self.top, ycheat, xpos, xtail,
+                                       ytop+ycheat, step)
+            newbottom = self.ycheat_curve(self.bottom, -ycheat, xpos, xtail,
+                                          ybottom-ycheat, step)
             self.top = newtop
             self.bottom = newbottom
             # rebuild the polygon (which loses any cuts that might
@@ -446,9 +432,9 @@ class Airfoil(Contour):
         # you can see exactly the trailing edge part that gets cutout.
         exact_shape = False
         if exact_shape:
-            self.poly = self.poly - contour
+            self.subtract(contour)
         else:
-            self.poly = self.poly - mask
+            self.subtract(mask)
 
         result = []
         for p2 in contour[0]:
@@ -479,15 +465,12 @@ class Airfoil(Contour):
             return
 
         step = 0.001
-        xpos = xtail - step
-        cur_dist = step
-        # walk forward specified distances along the bottom curve
+        # walk forward the specified distance along the bottom curve
         # (starting at the back)
-        ybottom = 0.0
-        while cur_dist <= width and xpos >= xnose:
-            ybottom = self.simple_interp(self.bottom, xpos)
-            cur_dist = self.dist_2d( (xtail, ytail), (xpos, ybottom) )
-            xpos -= step
+        bottom = lambda x: self.simple_interp(self.bottom, x)
+        k = self.fit_trailing_edge(bottom, width, (xtail, ytail), xnose, step)
+        ybottom = bottom(xtail - k * step)
+        xpos = xtail - (k + 1) * step
 
         dx = xpos - xtail
         dy = ybottom - ytail
@@ -521,11 +504,11 @@ class Airfoil(Contour):
         # you can see exactly the trailing edge part that gets cutout.
         exact_shape = False
         if exact_shape:
-            self.poly = self.poly - contour
+            self.subtract(contour)
         else:
             print "poly:", self.poly
             print "mask:", mask
-            self.poly = self.poly - mask
+            self.subtract(mask)
 
         result = []
         for p2 in contour[0]:
@@ -3,6 +3,7 @@
 # Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
 # http://madesigner.flightgear.org
 
+import multiprocessing
 import re
 import sys
 import os.path
@@ -16,6 +17,7 @@ import props_json
 import ac3d
 import freecad
 import contour
+from structure import layout_parts_sheets_shared
 from wing import Wing
 
 
@@ -30,15 +32,24 @@ class Builder():
 
     def __init__(self, design, dirname=None,
                  airfoil_resample=25, circle_points=8,
-                 nest_speed="fast"):
+                 nest_speed="fast", build=True, nest_budget=None,
+                 workers=1):
         # airfoil_resample: 25 = fast, 100 = mid, 1000 = quality
         # circle_points: 8 = fast, 16 = mid, 32 = quality
+        # nest_budget: seconds to spend optimizing the sheet layout
+        # build: False = only parse the design (no sheets, plans or model)
+        # workers: processes for the nesting searches (1 = search in
+        # this process)
         self.airfoil_resample = airfoil_resample
         self.circle_points = circle_points
         self.nest_speed = nest_speed
+        self.nest_budget = nest_budget
+        self.workers = workers
         self.design = design
         self.dirname = dirname
-        self.do_build()
+        self.make_plans = build
+        if build:
+            self.do_build()
 
     # return a list of start/end/part triplets for a structure that
     # spans the given start/end stations.  The structure is separated
@@ -109,6 +120,13 @@ class Builder():
         self.units = node.getString('units')
         self.sheet_w = myfloat(node, 'sheet_width')
         self.sheet_h = myfloat(node, 'sheet_height')
+        # optional catalogue of stock sheet sizes to choose from
+        self.sheet_stock = []
+        for i in range(node.getLen('sheet_stock')):
+            stock = node.getChild('sheet_stock[%d]' % i)
+            self.sheet_stock.append( (myfloat(stock, 'width'),
+                                      myfloat(stock, 'height'),
+                                      myfloat(stock, 'cost')) )
         self.plans_w = myfloat(node, 'plans_width')
         self.plans_h = myfloat(node, 'plans_height')
 
@@ -448,10 +466,9 @@ class Builder():
             self.parse_build_tab(wing, node.getChild('build_tab[%d]' % i))
 
         wing.build()
-        wing.layout_parts_sheets( self.sheet_w, self.sheet_h, units=self.units,
-                                  speed=self.nest_speed)
         #wing.layout_parts_templates( 8.5, 11 )
-        wing.layout_plans( self.plans_w, self.plans_h, units=self.units )
+        if self.make_plans:
+            wing.layout_plans( self.plans_w, self.plans_h, units=self.units )
 
         return wing
 
@@ -464,6 +481,17 @@ class Builder():
         # no match
         return -1
 
+    # parse the overview and build the structure of every wing
+    def parse_design(self):
+        node = self.design.getChild('overview', True)
+        self.parse_overview(node)
+
+        self.wings = []
+        for i in range(self.design.getLen('wing')):
+            wing_node = self.design.getChild('wing[%d]' % i)
+            wing = self.parse_wing(wing_node)
+            self.wings.append(wing)
+
     def do_build(self):
         print "do build"
         # if not os.path.exists(filename):
@@ -479,14 +507,18 @@ class Builder():
         # self.basename = os.path.basename(filename)
         # self.baseroot, ext = os.path.splitext(self.basename)
 
-        node = self.design.getChild('overview', True)
-        self.parse_overview(node)
+        self.parse_design()
 
-        self.wings = []
-        for i in range(self.design.getLen('wing')):
-            wing_node = self.design.getChild('wing[%d]' % i)
-            wing = self.parse_wing(wing_node)
-            self.wings.append(wing)
+        # nest the ribs of all the wings together on one set of sheets
+        if len(self.wings):
+            layout_parts_sheets_shared( self.wings, self.dirname + "parts-sheet",
+                                        self.sheet_w, self.sheet_h,
+                                        units=self.units,
+                                        speed=self.nest_speed,
+                                        budget=self.nest_budget,
+                                        stock=self.sheet_stock,
+                                        cache_dir=self.dirname + "nest-cache",
+                                        workers=self.workers )
 
         # generate AC3D model
         # if len(self.wings):
@@ -533,7 +565,8 @@ def main():
         return
     else:
         initfile = sys.argv[1]
-    build = Builder(initfile)
+    build = Builder(initfile, workers=multiprocessing.cpu_count())
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     main()
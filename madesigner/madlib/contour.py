@@ -6,9 +6,13 @@ __version__ = "1.0"
 __license__ = "GPL v2"
 
 
+import bisect
 import fileinput
+import heapq
 import math
+import numpy as np
 import string
+import nfp
 import spline
 import Polygon
 import Polygon.Shapes
@@ -59,9 +63,53 @@ class Contour:
         self.top = []
         self.bottom = []
         self.poly = None
+        self.cuts = []          # queued masks to subtract from self.poly
+        self.batch = False      # queue the cuts (see begin_cuts())
         self.cut_lines = []     # extra cut lines (maybe internal)
         self.labels = []
         self.saved_bounds = []  # see self.save_bounds() for details
+        self.version = 0        # bumped by changed()
+        self.derived = {}       # see self.derive() for details
+        self.derived_key = None
+        self.edges = None       # see self.poly_edges() for details
+
+    # note a change to the top/bottom curves (so the derived data is
+    # rebuilt)
+    def changed(self):
+        self.version += 1
+
+    # data derived from the curves (bounds, slopes, arc lengths) is
+    # built by build() the first time it is asked for and then kept
+    # under name until the curves change: changed() is called (by
+    # scale, move, rotate, trim and fit) or a curve is replaced or
+    # grows.
+    def derive(self, name, build):
+        key = self.derived_key
+        if key == None or key[0] != self.version \
+                or key[1] is not self.top or key[2] != len(self.top) \
+                or key[3] is not self.bottom or key[4] != len(self.bottom):
+            self.derived = {}
+            self.derived_key = ( self.version, self.top, len(self.top),
+                                 self.bottom, len(self.bottom) )
+        if name not in self.derived:
+            self.derived[name] = build()
+        return self.derived[name]
+
+    # the x positions of the points of a surface curve and the slope
+    # at each one (like spline.derivative1())
+    def slopes(self, surf="top"):
+        def build():
+            if surf == "top":
+                curve = self.top
+            else:
+                curve = self.bottom
+            c = np.array(curve, dtype=float).reshape(-1, 2)
+            slopes = np.empty(len(c))
+            slopes[0] = (c[1,1] - c[0,1]) / (c[1,0] - c[0,0])
+            slopes[-1] = (c[-1,1] - c[-2,1]) / (c[-1,0] - c[-2,0])
+            slopes[1:-1] = (c[2:,1] - c[:-2,1]) / (c[2:,0] - c[:-2,0])
+            return (c[:,0], slopes)
+        return self.derive("slopes " + surf, build)
 
     def dist_2d(self, pt1, pt2):
         result = 0.0
@@ -91,40 +139,126 @@ class Contour:
         else:
             return points[index][1]
 
+    # the arc length parameterization of a surface curve: arrays of
+    # the x and y of each curve point and the distance along the curve
+    # from the first point to each one.  (The other arc queries all go
+    # through here, so this is where an unknown surface is caught.)
+    def arc_length(self, surf="top"):
+        if surf != "top" and surf != "bottom":
+            raise ValueError("unknown surface curve: " + str(surf))
+        def build():
+            if surf == "top":
+                curve = self.top
+            else:
+                curve = self.bottom
+            c = np.array(curve, dtype=float).reshape(-1, 2)
+            steps = np.hypot(np.diff(c[:,0]), np.diff(c[:,1]))
+            dist = np.concatenate( ([0.0], np.cumsum(steps)) )
+            return (c[:,0], c[:,1], dist)
+        return self.derive("arc " + surf, build)
+
+    # distance along a surface curve from its first point to xpos
+    # (clamped to the ends of the curve)
+    def arc_position(self, surf="top", xpos=0.0):
+        (x, y, dist) = self.arc_length(surf)
+        n = len(x)
+        if n < 2 or xpos <= x[0]:
+            return 0.0
+        if xpos >= x[n-1]:
+            return dist[n-1]
+        # (the same segment as spline.binsearch())
+        i = min(int(np.searchsorted(x, xpos, side='right')) - 1, n - 2)
+        xrange = x[i+1] - x[i]
+        if xrange <= 0.0:
+            return dist[i]
+        return dist[i] + (dist[i+1] - dist[i]) * (xpos - x[i]) / xrange
+
+    # distance along a surface curve between x0 and x1 (negative if x1
+    # is in front of x0)
+    def arc_distance(self, surf="top", x0=0.0, x1=0.0):
+        return self.arc_position(surf, x1) - self.arc_position(surf, x0)
+
+    # the x position dist along a surface curve from xstart (toward
+    # the front if dist is negative, stopping at the ends of the curve)
+    def arc_xpos(self, surf="top", xstart=0.0, dist=0.0):
+        (x, y, arc) = self.arc_length(surf)
+        n = len(x)
+        target = self.arc_position(surf, xstart) + dist
+        if n < 2 or target <= 0.0:
+            return x[0]
+        if target >= arc[n-1]:
+            return x[n-1]
+        i = int(np.searchsorted(arc, target))
+        pct = (target - arc[i-1]) / (arc[i] - arc[i-1])
+        return x[i-1] + (x[i] - x[i-1]) * pct
+
+    # the edges of self.poly as (ax, ay, bx, by) where a is the end
+    # with the lower x (p1 on a tie)
+    def edge_list(self):
+        for contour in self.poly:
+            p0 = contour[len(contour)-1]
+            for p1 in contour:
+                if p0[0] < p1[0]:
+                    yield (p0[0], p0[1], p1[0], p1[1])
+                else:
+                    yield (p1[0], p1[1], p0[0], p0[1])
+                p0 = p1
+
+    # the edges of self.poly that may span xpos.  Once the same
+    # outline has been queried a few times an index of the edges sorted
+    # by their left x (plus the widest edge) is built so the
+    # candidates are found with a binary search.  The first queries
+    # just scan all the edges (building the index costs about as much
+    # as a few scans.)  The index is dropped when self.poly changes.
+    def poly_edges(self, xpos):
+        if self.edges == None or self.edges[0] is not self.poly \
+                or self.edges[1] != self.version:
+            self.edges = (self.poly, self.version, 0, None)
+        (poly, version, scans, index) = self.edges
+        if index == None and scans < 3:
+            self.edges = (poly, version, scans + 1, None)
+            return self.edge_list()
+        if index == None:
+            edges = sorted(self.edge_list(), key=lambda e: e[0])
+            keys = [ e[0] for e in edges ]
+            width = 0.0
+            for e in edges:
+                width = max(width, e[2] - e[0])
+            # (padded a little against rounding)
+            width = width * 1.000001 + 1e-9
+            index = (keys, edges, width)
+            self.edges = (poly, version, scans, index)
+        (keys, edges, width) = index
+        lo = bisect.bisect_left(keys, xpos - width)
+        hi = bisect.bisect_right(keys, xpos)
+        return edges[lo:hi]
+
     def poly_intersect(self, surf="top", xpos=0.0):
         if self.poly == None:
             self.make_poly()
+        # (queued cuts that don't reach xpos can't change the answer)
+        for mask in self.cuts:
+            bounds = mask.boundingBox()
+            if bounds[0] <= xpos and bounds[1] >= xpos:
+                self.apply_cuts()
+                break
 
         ymin = None
         ymax = None
-        #print "poly contours = " + str(len(self.poly))
-        for index, contour in enumerate(self.poly):
-            #print "contour " + str(index) + " = " + str(contour)
-            p0 = contour[len(contour)-1]
-            for p1 in contour:
-                #print " p1 = " + str(p1) + " xpos = " + str(xpos)
-                if p0 != None:
-                    if p0[0] < p1[0]:
-                        a = p0
-                        b = p1
-                    else:
-                        a = p1
-                        b = p0
-                    if a[0] <= xpos and b[0] >= xpos:
-                        #print "found a spanning segment!"
-                        # a & b span xpos
-                        xrange = b[0] - a[0]
-                        yrange = b[1] - a[1]
-                        if xrange > 0.0001:
-                            percent = (xpos - a[0]) / xrange
-                            ypos= a[1] + percent * yrange
-                        else:
-                            ypos = a[1]
-                        if ymin == None or ypos < ymin:
-                            ymin = ypos
-                        if ymax == None or ypos > ymax:
-                            ymax = ypos
-                p0 = p1
+        for (ax, ay, bx, by) in self.poly_edges(xpos):
+            if ax <= xpos and bx >= xpos:
+                # a & b span xpos
+                xrange = bx - ax
+                yrange = by - ay
+                if xrange > 0.0001:
+                    percent = (xpos - ax) / xrange
+                    ypos = ay + percent * yrange
+                else:
+                    ypos = ay
+                if ymin == None or ypos < ymin:
+                    ymin = ypos
+                if ymax == None or ypos > ymax:
+                    ymax = ypos
 
         if surf == "top":
             return ymax
@@ -134,52 +268,53 @@ class Contour:
     def fit(self, maxpts = 30, maxerror = 0.1):
         self.top = list( self.curve_fit(self.top, maxpts, maxerror) )
         self.bottom = list( self.curve_fit(self.bottom, maxpts, maxerror) )
-
+        self.changed()
+
+    # simplify a curve: starting with the end points, keep adding the
+    # original point that is furthest off (vertically) from the
+    # simplified curve until none is more than maxerror off, or there
+    # are maxpts points.  Adding a point only changes the simplified
+    # curve between its two neighbors, so the furthest off point of
+    # each span is found once (when the span is made) and the spans
+    # are kept in a heap by that error.
     def curve_fit(self, curve, maxpts = 30, maxerror = 0.1):
-        wip = []
-
-        # start with the end points
         n = len(curve)
-        wip.append( curve[0] )
-        wip.append( curve[n-1] )
+        c = np.array(curve, dtype=float).reshape(-1, 2)
+        heap = []
 
-        # iterate until termination conditions are met
-        done = False
-        while not done:
-            maxy = 0
-            maxx = 0
-            maxdiff = 0
-            maxi = -1
-            # iterate over the orginal interior points
-            for i in range(1, n-1):
-                pt = curve[i]
-                iy = self.simple_interp(wip, pt[0])
-                diff = math.fabs(pt[1] - iy)
-                if diff > maxdiff and diff > maxerror:
-                    maxdiff = diff
-                    maxi = i
-                    maxx = pt[0]
-                    maxy = pt[1]
-
-            if maxi > -1:
-                # found a match for a furthest off point
-	        #print "($#wipx) inserting -> $maxx , $maxy at pos ";
-
-                # find insertion point
-                pos = 0
-                wipn = len(wip)
-                #print str(pos) + " " + str(wipn)
-                while pos < wipn and maxx > wip[pos][0]:
-                    pos += 1
-                    #print pos
-	        #print "$pos\n";
-                wip.insert( pos, (maxx, maxy) )
+        # queue the furthest off point between original points a and b
+        def add_span(a, b):
+            if b - a < 2:
+                return
+            (x0, y0) = c[a]
+            (x1, y1) = c[b]
+            pts = c[a+1:b]
+            xrange = x1 - x0
+            if xrange > 0.0001:
+                iy = y0 + ((pts[:,0] - x0) / xrange) * (y1 - y0)
             else:
-                done = True
-
-            if len(wip) >= maxpts:
-                done = True
-
+                iy = y0
+            diff = np.abs(pts[:,1] - iy)
+            k = int(np.argmax(diff))
+            if diff[k] > maxerror:
+                # (ties go to the first point like a plain scan would)
+                heapq.heappush(heap, (-diff[k], a + 1 + k, a, b))
+
+        keep = [ 0, n - 1 ]
+        add_span(0, n - 1)
+        while len(heap):
+            (diff, i, a, b) = heapq.heappop(heap)
+            keep.append(i)
+            if len(keep) >= maxpts:
+                break
+            add_span(a, i)
+            add_span(i, b)
+
+        keep.sort()
+        wip = [ curve[0] ]
+        for i in keep[1:-1]:
+            wip.append( (curve[i][0], curve[i][1]) )
+        wip.append( curve[n-1] )
         return wip
 
     def display(self):
@@ -219,9 +354,12 @@ class Contour:
             for pt in self.saved_bounds:
                 newbounds.append( self.rotate_point(pt, angle) )
             self.saved_bounds = list(newbounds)
+        self.changed()
 
         if self.poly != None:
             self.poly.rotate(math.radians(angle), 0.0, 0.0)
+        for mask in self.cuts:
+            mask.rotate(math.radians(angle), 0.0, 0.0)
 
     def scale(self, hsize, vsize):
         newtop = []
@@ -242,6 +380,7 @@ class Contour:
         self.top = list(newtop)
         self.bottom = list(newbottom)
         self.labels = list(newlabels)
+        self.changed()
 
     def move(self, x, y):
         newtop = []
@@ -262,6 +401,7 @@ class Contour:
         self.top = list(newtop)
         self.bottom = list(newbottom)
         self.labels = list(newlabels)
+        self.changed()
 
     # the saved "bounds" are used cooperatively to mark the size of
     # the part before any leading/trailing edge cutouts so that these
@@ -301,13 +441,11 @@ class Contour:
         return xpos
 
     def get_slope(self, surf="top", xpos=0.0):
-        if surf == "top":
-            curve = list(self.top)
-        else:
-            curve = list(self.bottom)
-        slopes = spline.derivative1(curve)
-        index = spline.binsearch(curve, xpos)
-        slope = slopes[index]
+        (x, slopes) = self.slopes(surf)
+        # (the same point as spline.binsearch())
+        index = int(np.searchsorted(x, xpos, side='right')) - 1
+        index = max(0, min(index, len(x) - 2))
+        slope = float(slopes[index])
         return slope
 
     # given a line (point + slope) return the "xpos" of the
@@ -315,9 +453,9 @@ class Contour:
     # of a vertical slope in either line)
     def intersect(self, surf="top", pt=None, slope=None):
         if surf == "top":
-            curve = list(self.top)
+            curve = self.top
         else:
-            curve = list(self.bottom)
+            curve = self.bottom
         m1 = slope
         b1 = pt[1] - m1 * pt[0]
         n = len(curve)
@@ -348,9 +486,9 @@ class Contour:
     # trim everything front or rear of a given position
     def trim(self, surf="top", discard="rear", cutpos=None, station=None):
         if surf == "top":
-            curve = list(self.top)
+            curve = self.top
         else:
-            curve = list(self.bottom)
+            curve = self.bottom
         newcurve = []
         xpos = self.get_xpos(cutpos, station)
         ypos = self.simple_interp(curve, xpos)
@@ -379,6 +517,7 @@ class Contour:
             self.top = list(newcurve)
         else:
             self.bottom = list(newcurve)
+        self.changed()
  
     # build the Polygon representation of the shape from the
     # top/bottom curves.  The Polygon representation is used for doing
@@ -390,8 +529,62 @@ class Contour:
         reverse_top.reverse()
         shape = reverse_top + self.bottom
         self.poly = Polygon.Polygon(shape)
+        self.cuts = []
         # todo: add holes (should be easy, but want to work on other
         # aspects first)
+
+    # subtract a mask (Polygon) from the shape.  Between begin_cuts()
+    # and end_cuts() the masks are only queued, then merged and
+    # subtracted from the outline in one go, rather than clipping the
+    # whole (ever more complex) outline again for every cut.
+    def subtract(self, mask):
+        if self.poly == None:
+            self.make_poly()
+        if self.batch:
+            self.cuts.append(mask)
+        else:
+            self.poly = self.poly - mask
+
+    def begin_cuts(self):
+        self.batch = True
+
+    def end_cuts(self):
+        self.apply_cuts()
+        self.batch = False
+
+    # subtract the queued masks now.  Most of them are notches
+    # (stringers, spars, edge stock) that don't touch any other mask:
+    # those go into the mask polygon as they are and only the masks
+    # whose bounding boxes overlap are unioned first.
+    def apply_cuts(self):
+        if len(self.cuts) == 0:
+            return
+        boxes = sorted( [ (mask.boundingBox(), i)
+                          for i, mask in enumerate(self.cuts) if len(mask) ] )
+        alone = [ True ] * len(self.cuts)
+        # (sweep the boxes in order of their left x)
+        for a in range(len(boxes)):
+            (ba, ia) = boxes[a]
+            for b in range(a + 1, len(boxes)):
+                (bb, ib) = boxes[b]
+                if bb[0] > ba[1]:
+                    break
+                if bb[2] <= ba[3] and bb[3] >= ba[2]:
+                    alone[ia] = False
+                    alone[ib] = False
+        masks = Polygon.Polygon()
+        rest = []
+        for mask, single in zip(self.cuts, alone):
+            if single and len(mask) == 1 and not mask.isHole(0):
+                masks.addContour(mask[0])
+            else:
+                rest.append(mask)
+        if len(rest):
+            merged = nfp.union_all(rest)
+            for k, c in enumerate(merged):
+                masks.addContour(c, merged.isHole(k))
+        self.poly = self.poly - masks
+        self.cuts = []
         
     # surf={top,bottom} (attached to top or bottom of airfoil)
     # orientation={tangent,vertical} (aligned vertically or flush with surface)
@@ -451,7 +644,7 @@ class Contour:
         p2 = ( r2[0] + xpos, r2[1] + ypos )
         p3 = ( r3[0] + xpos, r3[1] + ypos )
         mask = Polygon.Polygon( (p0, p1, p2, p3) )
-        self.poly = self.poly - mask
+        self.subtract(mask)
 
         # also make the true shape while we are here (reusing the
         # bottom of the cut mask)
@@ -515,6 +708,7 @@ class Contour:
         p3 = (x2, ybase)
 
         tab = Polygon.Polygon( (p0, p1, p2, p3) )
+        self.apply_cuts()
         self.poly = self.poly + tab
 
 
@@ -553,7 +747,7 @@ class Contour:
             self.make_poly()
         hole = Polygon.Shapes.Circle(radius=radius, center=(xpos, ypos), \
                                          points=points)
-        self.poly = self.poly - hole
+        self.subtract(hole)
 
     def add_label(self, xpos, ypos, size, rotate, text):
         self.labels.append( (xpos, ypos, size, rotate, text) )        
@@ -571,77 +765,67 @@ class Contour:
         pt = ( r0[0] + orig[0], r0[1] + orig[1] )
         return pt
 
-    def project_contour(self, surf="top",
-                        xstart=0, xend=None, xdist=None,
-                        ysize=0):
-        #print "xstart=" + str(xstart) + " xend=" + str(xend) + " xdist=" + str(xdist)
-        curve = []
-        #print "surf == " + surf
+    # walk a surface curve from xstart (for xdist along the curve, or
+    # up to xend) and project that stretch of the surface by each of
+    # the ysizes (along the surface normal, positive is into the part.)
+    # The curve is walked once for all the ysizes.  Returns a list of
+    # (n, 2) arrays, one for each ysize.
+    def project_contours(self, surf="top", xstart=0, xend=None, xdist=None,
+                         ysizes=(0,)):
         if surf == "top":
-            curve = list(self.top)
+            curve = self.top
         else:
-            curve = list(self.bottom)
-        #print str(curve)
-
-        n = len(curve)
-        slopes = spline.derivative1(curve)
-        shape = []
-
-        # make the exact sweep base line
-        dist = 0.0
-        xpos = xstart
-        #print 'xpos:', xpos, 'curve:', curve
-        ypos = self.simple_interp(curve, xstart)
-        if ypos:
-            shape.append( (xpos, ypos) )
-        index = spline.binsearch(curve, xpos)
-        if curve[index][0] <= xpos:
+            curve = self.bottom
+        (x, y, arc) = self.arc_length(surf)
+        c = np.column_stack( (x, y) )
+        n = len(c)
+
+        # the curve points past xstart that are still inside the
+        # stretch (with the distance walked to each)
+        ystart = self.simple_interp(curve, xstart)
+        index = spline.binsearch(curve, xstart)
+        if curve[index][0] <= xstart:
             index += 1
-        next_dist = 0
-        done = False
-        #while index < n and dist + next_dist <= xdist:
-        while index < n and not done:
-            nextpt = curve[index]
-            next_dist = self.dist_2d( (xpos, ypos), nextpt )
-            if (xdist and dist + next_dist <= xdist) or \
-                    (xend and nextpt[0] <= xend):
-                dist += next_dist
-                xpos = nextpt[0]
-                ypos = nextpt[1]
-                if ypos:
-                    shape.append( (xpos, ypos) )
-                index += 1
-            else:
-                done = True
-
-        # add the final point of the curve (if needed)
-        if index < n and xdist and dist < xdist:
-            rem = xdist - dist
-            #print "rem = " + str(rem)
-            pct = rem / next_dist
-            #print "pct of next step = " + str(pct)
-            dx = nextpt[0] - xpos
-            xpos += dx * pct
-            ypos = self.simple_interp(curve, xpos)
-            if ypos:
-                shape.append( (xpos, ypos) )
-        elif index < n and xend and xpos < xend:
-            xpos = xend
-            ypos = self.simple_interp(curve, xpos)
-            if ypos:
-                shape.append( (xpos, ypos) )
-
-        # project the sweep line at the specified thickness
-        result = []
-        #print 'shape:', shape
-        for p in shape:
-            index = spline.binsearch(curve, p[0])
-            slope = slopes[index]
-            #print 'p:', p
-            proj = self.project_point(p, ysize, surf, slope)
-            result.append(proj)
+        pts = c[index:]
+        dist = arc[index:] - self.arc_position(surf, xstart)
+        inside = np.zeros(len(pts), dtype=bool)
+        if xdist:
+            inside |= dist <= xdist
+        if xend:
+            inside |= pts[:,0] <= xend
+        count = len(pts) if np.all(inside) else int(np.argmin(inside))
+
+        shape = [ (xstart, ystart) ] + [ tuple(p) for p in pts[:count] ]
+        (xpos, ypos) = shape[-1]
+        walked = dist[count-1] if count else 0.0
+
+        # add the final point of the stretch (if needed)
+        if count < len(pts):
+            if xdist and walked < xdist:
+                xpos = self.arc_xpos(surf, xstart, xdist)
+                shape.append( (xpos, self.simple_interp(curve, xpos)) )
+            elif xend and xpos < xend:
+                shape.append( (xend, self.simple_interp(curve, xend)) )
+        # (points without a height are dropped)
+        shape = np.array( [ p for p in shape if p[1] ], dtype=float ).reshape(-1, 2)
+
+        # surface slope at each point (like spline.derivative1() and
+        # spline.binsearch()) and the normals into the part
+        (xkeys, slopes) = self.slopes(surf)
+        k = np.clip(np.searchsorted(xkeys, shape[:,0], side='right') - 1,
+                    0, n - 2)
+        angle = np.arctan(slopes[k])
+        normal = np.column_stack( (-np.sin(angle), np.cos(angle)) )
+        if surf == "top":
+            normal = -normal
+        return [ shape + ysize * normal for ysize in ysizes ]
 
-        return result
+    def project_contour(self, surf="top",
+                        xstart=0, xend=None, xdist=None,
+                        ysize=0):
+        result = self.project_contours(surf=surf, xstart=xstart, xend=xend,
+                                       xdist=xdist, ysizes=(ysize,))
+        return [ tuple(p) for p in result[0].tolist() ]
 
     def cutout_sweep(self, surf="top", xstart=0.0, xend=None, xdist=None,
                      ysize=0.0, pos=None, nudge=0.0):
@@ -649,20 +833,15 @@ class Contour:
         #print "xstart = " + str(xstart) + " xend = " + str(xend) + " xdist = " + str(xdist)
         if self.poly == None:
             self.make_poly()
-        flush = self.project_contour(surf=surf, xstart=xstart,
-                                     xend=xend, xdist=xdist,
-                                     ysize=0.0)
-        surf1 = self.project_contour(surf=surf, xstart=xstart,
-                                     xend=xend, xdist=xdist,
-                                     ysize=-ysize)
-        surf2 = self.project_contour(surf=surf, xstart=xstart,
-                                     xend=xend, xdist=xdist,
-                                     ysize=ysize)
-        surf1.reverse()
-        shape = surf1 + surf2
-        mask = Polygon.Polygon(shape)
+        (flush, surf1, surf2) = self.project_contours(surf=surf, xstart=xstart,
+                                                      xend=xend, xdist=xdist,
+                                                      ysizes=(0.0, -ysize,
+                                                              ysize))
+        mask = Polygon.Polygon(np.concatenate( (surf1[::-1], surf2) ))
         #print str(mask)
-        self.poly = self.poly - mask
+        self.subtract(mask)
+        flush = flush.tolist()
+        surf2 = surf2.tolist()
 
         # generate 3d points as top surface and bottom surface
         top = []
@@ -678,42 +857,6 @@ class Contour:
         else:
             return (bot, top)
 
-    # quick scan polygons for possible degenerate problems.  these can
-    # occur due to odd numerical issues when we pile a lot of stuff on
-    # top of each other close together.
-    def reduce_degeneracy(self, poly):
-        result = Polygon.Polygon()
-        for c in poly:
-            # look for simple out and backs (zero width peninsula)
-            shape1 = []
-            n = len(c)
-            shape1.append(c[0])
-            shape1.append(c[1])
-            i = 2
-            while i < n:
-                if math.fabs(c[i][0]-c[i-2][0]) > 0.001 or \
-                        math.fabs(c[i][1]-c[i-2][1]) > 0.001:
-                    shape1.append(c[i])
-                else:
-                    print "--> found zero width peninsula!!!"
-                i += 1
-
-            # look for 3 points in a row with the same x value
-            shape2 = []
-            shape2.append(shape1[0])
-            i = 1
-            while i < n - 1:
-                if math.fabs(c[i-1][0]-c[i][0]) > 0.001 or \
-                        math.fabs(c[i+1][0]-c[i][0]) > 0.001:
-                    shape2.append(c[i])
-                else:
-                    print "--> found 3x in a row!!!"
-                i += 1
-            shape2.append(shape1[n-1])
-
-            result.addContour(shape2)
-        return result            
-
     # follow the inner contour of the rib on the top and bottom and
     # (hopefully) add rounded corners.  Right now left right walls are
     # vertical, but it should be possible to do angles (to leave an
@@ -729,17 +872,15 @@ class Contour:
         # hollow entire interior (longitudinal axis) at cut radius +
         # corner radius.  This like the center 'cut' line if we were
         # cutting with a 'radius' radius tool.
-        top = self.project_contour(surf="top",
-                                   xstart=bounds[0][0],
-                                   xend=bounds[1][0],
-                                   ysize=material_width+radius)
-        bot = self.project_contour(surf="bottom",
-                                   xstart=bounds[0][0],
-                                   xend=bounds[1][0],
-                                   ysize=material_width+radius)
-        top.reverse()
-        shape = top + bot
-        mask1 = Polygon.Polygon(shape)
+        (top,) = self.project_contours(surf="top",
+                                       xstart=bounds[0][0],
+                                       xend=bounds[1][0],
+                                       ysizes=(material_width+radius,))
+        (bot,) = self.project_contours(surf="bottom",
+                                       xstart=bounds[0][0],
+                                       xend=bounds[1][0],
+                                       ysizes=(material_width+radius,))
+        mask1 = Polygon.Polygon(np.concatenate( (top[::-1], bot) ))
 
         # vertical column (narrowed by radius)
         xstart = self.get_xpos( pos1, sweep=sweep ) + radius
@@ -756,35 +897,26 @@ class Contour:
         # this polygon, the outer bounds of that cut is the final
         # shape we want
         mask_cut = mask1 & mask2
+        if len(mask_cut) == 0:
+            # the section is too thin (or too short) here to fit the
+            # hole with the requested material width
+            return
 
         # pretend we are cutting by placing a 'radius' size circle at
-        # each point in the cut line and taking the union of all of
-        # those (incrementally)
-
-        #plt.plot(*zip(*mask_cut.contour(0)))
-
-        mask = None
-        for p in mask_cut[0]:
-            circle = Polygon.Shapes.Circle(radius=radius, center=p, points=circle_points)
-
-            if mask == None:
-                mask = circle
-            else:
-
-                mask = Polygon.Utils.convexHull(mask | circle)
-                mask = self.reduce_degeneracy(mask)
-
-
-
-
-        mask = Polygon.Utils.convexHull(mask)
-        #for p in mask:
-        #    print "contour..."
-        #    print p
-
-
-
-        self.poly = self.poly - mask
+        # each point in the cut line and taking the convex hull of all
+        # of those.  Only the circles around the corners of the hull of
+        # the cut line can reach the outside, so that is the hull of
+        # the cut line grown by the radius: one hull of its corners
+        # offset by each circle point.
+        hull = Polygon.Utils.convexHull(Polygon.Polygon(mask_cut[0]))
+        corners = np.array(hull[0])
+        a = 2.0 * math.pi * np.arange(circle_points) / circle_points
+        circle = radius * np.column_stack( (np.sin(a), np.cos(a)) )
+        cloud = corners[:,np.newaxis,:] + circle[np.newaxis,:,:]
+        cloud = cloud.reshape(-1, 2)
+        mask = Polygon.Utils.convexHull(Polygon.Polygon(cloud))
+
+        self.subtract(mask)
 
         z = 0
 
@@ -796,18 +928,9 @@ class Contour:
     def get_bounds(self):
         if len(self.top) < 1:
             return ( (0,0), (0,0) )
-        pt = self.top[0]
-        minx = pt[0]
-        maxx = pt[0]
-        miny = pt[1]
-        maxy = pt[1]
-        for pt in self.top + self.bottom:
-            if pt[0] < minx:
-                minx = pt[0]
-            if pt[0] > maxx:
-                maxx = pt[0]
-            if pt[1] < miny:
-                miny = pt[1]
-            if pt[1] > maxy:
-                maxy = pt[1]
-        return ( (minx, miny), (maxx, maxy) )
+        def build():
+            c = np.array(self.top + self.bottom, dtype=float)
+            (minx, miny) = c.min(axis=0).tolist()
+            (maxx, maxy) = c.max(axis=0).tolist()
+            return ( (minx, miny), (maxx, maxy) )
+        return self.derive("bounds", build)
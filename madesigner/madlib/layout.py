@@ -7,7 +7,9 @@ __license__ = "GPL v2"
 
 
 import copy
+import hashlib
 import math
+import multiprocessing
 import numpy as np
 import Polygon
 import Polygon.IO
@@ -15,6 +17,387 @@ import Polygon.Utils
 import svgwrite
 
 import airfoil
+import nestcache
+import nfp
+import raster
+import sat
+
+
+# make the collision outline (hull) of a part polygon for the
+# requested nesting speed/quality.  The hull is grown by a step so
+# nested parts always end up at least a step apart.
+def make_hull(p, speed, step):
+    bounds = p.boundingBox()
+    dx = bounds[1] - bounds[0]
+    dy = bounds[3] - bounds[2]
+    box = Polygon.Polygon( [ [bounds[0], bounds[2]],
+                             [bounds[1], bounds[2]],
+                             [bounds[1], bounds[3]],
+                             [bounds[0], bounds[3]] ])
+    if speed == "fast":
+        hull = box
+    elif speed == "medium":
+        # make convex hull outline of polygon, and make grow it a tiny bit
+        hull = Polygon.Utils.convexHull(p)
+    elif speed == "convex" or speed == "nice" or speed == "nfp" or \
+            speed == "holes":
+        # more details polygon yields better fit, but nesting takes longer
+        hull = Polygon.Utils.fillHoles(p)
+    else:
+        print "ERROR: Unknown nesting speed/quality:", speed
+        print "Defaulting to 'fast'"
+        hull = box
+    hull.scale((dx+step)/dx, (dy+step)/dy)
+    if speed == "holes":
+        hull = open_holes(p, hull, step)
+    return hull
+
+# the band of points within dist of the edges of a contour: each edge
+# swept by an octagon around a circle of radius dist.
+def edge_band(c, dist):
+    r = dist / math.cos(math.pi / 8)
+    ring = [ (r * math.cos(math.pi * (2*k + 1) / 8),
+              r * math.sin(math.pi * (2*k + 1) / 8)) for k in range(8) ]
+    pieces = []
+    p0 = c[len(c)-1]
+    for p1 in c:
+        pts = [ (p[0] + dx, p[1] + dy) for p in (p0, p1) for (dx, dy) in ring ]
+        pieces.append( Polygon.Utils.convexHull(Polygon.Polygon(pts)) )
+        p0 = p1
+    return nfp.union_all(pieces)
+
+# open up the holes of a part in its hull so smaller parts can be
+# nested inside.  The holes are shrunk by half a step, the same margin
+# the hulls are grown by, so parts nested inside end up a step away
+# from the edges (like two parts side by side.)  Pieces of the part
+# inside a hole are put back (grown by the same half step.)
+def open_holes(p, hull, step):
+    margin = step * 0.5
+    for k, c in enumerate(p):
+        if not p.isHole(k):
+            continue
+        hole = Polygon.Polygon(c)
+        xmin, xmax, ymin, ymax = hole.boundingBox()
+        if xmax - xmin <= 2*step or ymax - ymin <= 2*step:
+            # too small to hold anything
+            continue
+        space = hole - edge_band(c, margin)
+        if len(space) == 0:
+            continue
+        hull = hull - space
+        for m, d in enumerate(p):
+            if not p.isHole(m) and hole.isInside(d[0][0], d[0][1]):
+                hull = hull + Polygon.Polygon(d) + edge_band(d, margin)
+    return hull
+
+
+# a key that is the same for polygons with the same shape and position
+# (so the nesting work done for one can be reused for the others.)
+# Contours are compared independent of their direction and starting
+# vertex.
+def shape_key(poly):
+    contours = []
+    for i, c in enumerate(poly):
+        a = np.round(np.array(c, dtype=float), 6) + 0.0
+        if len(a) >= 3:
+            x = a[:,0]
+            y = a[:,1]
+            if np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)) < 0.0:
+                a = a[::-1]
+            a = np.roll(a, -np.lexsort( (a[:,1], a[:,0]) )[0], axis=0)
+        contours.append( str(poly.isHole(i)) + a.tostring() )
+    h = hashlib.md5()
+    for c in sorted(contours):
+        h.update(c)
+    return h.hexdigest()
+
+# translation independent keys of the shape of a polygon and of its
+# mirror image (flipped left to right.)  Parts with the same key are
+# identical, a part whose key matches another's mirror key is its
+# mirror twin.
+def shape_fingerprint(poly):
+    keys = []
+    for mirror in (False, True):
+        p = Polygon.Polygon(poly)
+        if mirror:
+            p.flip(0.0)
+        bounds = p.boundingBox()
+        p.shift(-bounds[0], -bounds[2])
+        keys.append( shape_key(p) )
+    return tuple(keys)
+
+# no-fit polygons of hull pairs (by key), shared by every sheet in this
+# process.  Cleared when it grows past nfp_cache_size entries.
+nfp_cache = {}
+nfp_cache_size = 20000
+
+
+# true if a hull is a plain (axis aligned) rectangle
+def is_box(hull):
+    bounds = hull.boundingBox()
+    box_area = (bounds[1] - bounds[0]) * (bounds[3] - bounds[2])
+    return len(hull) == 1 and len(hull[0]) == 4 \
+        and math.fabs(hull.area() - box_area) < 1e-9 * box_area
+
+
+# a part prepared for nesting: the part polygon flopped into sheet
+# (svg) orientation plus the collision hull.  This is computed once
+# per part and then tried against each sheet.
+class NestPart:
+
+    def __init__(self, part, speed="fast", step=0.1, angle=0.0):
+        if part.poly == None:
+            part.make_poly()
+        self.part = part
+        self.step = step
+        self.angle = angle      # orientation on the sheet (degrees)
+        self.poly = copy.deepcopy(part.poly)
+        self.poly.flop(0.0)
+        rotated = Polygon.Polygon(self.poly)
+        if angle != 0.0:
+            rotated.rotate(math.radians(angle), 0.0, 0.0)
+        bounds = rotated.boundingBox()
+        self.dx = bounds[1] - bounds[0]
+        self.dy = bounds[3] - bounds[2]
+        self.hull = make_hull(rotated, speed, step)
+        self.is_box = is_box(self.hull)
+        self.pieces = None
+        self.neg_pieces = None
+        self.key = shape_key(self.hull)
+        self.bitmap = None
+        self.core = None
+        self.sat = None
+
+    # the same nest part for another part with the same shape (the
+    # hull and everything derived from it is shared)
+    def copy_for(self, part):
+        nest = copy.copy(self)  # (goes through __getstate__)
+        nest.part = part
+        nest.poly = self.poly
+        return nest
+
+    # compute up front what the search for the given speed will need,
+    # so copies made afterwards share it
+    def prepare(self, speed, cell):
+        self.get_core(cell)
+        if speed == "nfp" or speed == "holes":
+            self.get_pieces()
+        elif speed == "convex":
+            self.get_bitmap(cell)
+            self.get_sat()
+        elif speed != "nice":
+            self.get_bitmap(cell)
+
+    # convex pieces of the hull (for no-fit polygon nesting.)
+    # Concavities shallower than a quarter step are filled in, they
+    # are too small to nest anything into anyway.
+    def get_pieces(self):
+        if self.pieces == None:
+            pieces = nfp.convex_pieces(self.hull, self.step * 0.25)
+            self.pieces = [ nfp.prepare_piece(c) for c in pieces ]
+            self.neg_pieces = [ nfp.prepare_piece(-c) for c in pieces ]
+        return self.pieces
+
+    # convex pieces mirrored through the origin (for when this is the
+    # moving part in a no-fit polygon.)
+    def get_neg_pieces(self):
+        self.get_pieces()
+        return self.neg_pieces
+
+    # only the collision geometry is needed to search for a position
+    # (in a worker process), leave the drawing data behind
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['part'] = None
+        state['poly'] = None
+        return state
+
+    # the convex pieces as arrays for separating axis tests (see
+    # sat.py)
+    def get_sat(self):
+        if self.sat == None:
+            self.sat = sat.piece_arrays(self.get_pieces())
+        return self.sat
+
+    # occupancy bitmap of the hull: (bitmap, i0, j0), see raster.py
+    def get_bitmap(self, cell):
+        if self.bitmap == None or self.bitmap[0] != cell:
+            self.bitmap = (cell, raster.rasterize(self.hull, cell))
+        return self.bitmap[1]
+
+    # (w, h) size in cells of the largest rectangle of whole cells
+    # inside the hull.  Wherever the hull goes this much room has to
+    # be free.
+    def get_core(self, cell):
+        if self.core == None or self.core[0] != cell:
+            (bitmap, i0, j0) = raster.interior(self.hull, cell)
+            self.core = (cell, raster.largest_rectangle(bitmap))
+        return self.core[1]
+
+
+# a group of nest parts at fixed offsets from each other (i.e. a stack
+# of identical ribs) that is nested as a single part.  members is a
+# list of (nest part, (x, y) offset).
+class NestGroup(NestPart):
+
+    def __init__(self, members, step=0.1):
+        self.part = None
+        self.poly = None
+        self.members = members
+        self.step = step
+        self.angle = 0.0
+        hulls = []
+        for (nest, offset) in members:
+            hull = Polygon.Polygon(nest.hull)
+            hull.shift(offset[0], offset[1])
+            hulls.append(hull)
+        self.hull = nfp.union_all(hulls)
+        bounds = self.hull.boundingBox()
+        self.dx = bounds[1] - bounds[0] - step
+        self.dy = bounds[3] - bounds[2] - step
+        self.is_box = is_box(self.hull)
+        self.key = shape_key(self.hull)
+        self.pieces = None
+        self.neg_pieces = None
+        self.bitmap = None
+        self.core = None
+        self.sat = None
+
+    # the convex pieces of the members (moved to their offsets) cover
+    # the group hull just as well
+    def get_pieces(self):
+        if self.pieces == None:
+            self.pieces = []
+            self.neg_pieces = []
+            for (nest, offset) in self.members:
+                o = np.array(offset, dtype=float)
+                for (start, edges, angles) in nest.get_pieces():
+                    self.pieces.append( (start + o, edges, angles) )
+                for (start, edges, angles) in nest.get_neg_pieces():
+                    self.neg_pieces.append( (start - o, edges, angles) )
+        return self.pieces
+
+    def __getstate__(self):
+        state = NestPart.__getstate__(self)
+        state['members'] = None
+        return state
+
+
+# skyline rectangle packer.  The skyline is the upper envelope of
+# everything placed on the sheet so far, kept as a list of (x, y,
+# width) segments sorted by x.  A rectangle can always be dropped
+# anywhere on top of the skyline without checking the parts below.
+class Skyline:
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.segments = [ (0.0, 0.0, width) ]
+
+    # return the (x, y) lower corner that places a w x h rectangle
+    # lowest on the skyline (ties go to the smallest x), or None if it
+    # doesn't fit.
+    def find(self, w, h):
+        best = None
+        n = len(self.segments)
+        for i in range(n):
+            x = self.segments[i][0]
+            if x + w > self.width + 1e-9:
+                break
+            # the rectangle rests on the highest segment it spans
+            y = 0.0
+            j = i
+            while j < n and self.segments[j][0] < x + w - 1e-9:
+                if self.segments[j][1] > y:
+                    y = self.segments[j][1]
+                j += 1
+            if y + h > self.height + 1e-9:
+                continue
+            if best == None or y < best[1] - 1e-9:
+                best = (x, y)
+        return best
+
+    # raise the skyline to cover the rectangle x0..x1 with top y1
+    def add(self, x0, x1, y1):
+        x0 = max(x0, 0.0)
+        x1 = min(x1, self.width)
+        if x1 <= x0:
+            return
+        result = []
+        for (x, y, w) in self.segments:
+            xe = x + w
+            if xe <= x0 or x >= x1 or y >= y1:
+                result.append( (x, y, w) )
+                continue
+            # split the segment into the part left of, under, and
+            # right of the new rectangle
+            if x < x0:
+                result.append( (x, y, x0 - x) )
+            result.append( (max(x, x0), y1, min(xe, x1) - max(x, x0)) )
+            if xe > x1:
+                result.append( (x1, y, xe - x1) )
+        # merge neighbors at the same height
+        self.segments = []
+        for seg in result:
+            if len(self.segments) and \
+                    math.fabs(self.segments[-1][1] - seg[1]) < 1e-9:
+                last = self.segments[-1]
+                self.segments[-1] = (last[0], last[1], last[2] + seg[2])
+            else:
+                self.segments.append(seg)
+
+
+# uniform grid index of the hulls placed on a sheet.  Each hull is
+# filed under every grid cell its bounding box touches, so a candidate
+# position only needs to be tested against its near neighbors instead
+# of the whole (ever growing) sheet mask.
+class PartIndex:
+
+    def __init__(self, width, height, divs=8):
+        self.cell = max(width, height) / float(divs)
+        self.buckets = {}
+        self.items = []         # (bounds, hull)
+
+    def cells(self, bounds):
+        i0 = int(math.floor(bounds[0] / self.cell))
+        i1 = int(math.floor(bounds[1] / self.cell))
+        j0 = int(math.floor(bounds[2] / self.cell))
+        j1 = int(math.floor(bounds[3] / self.cell))
+        for i in range(i0, i1+1):
+            for j in range(j0, j1+1):
+                yield (i, j)
+
+    def insert(self, hull):
+        bounds = hull.boundingBox()
+        id = len(self.items)
+        self.items.append( (bounds, hull) )
+        for key in self.cells(bounds):
+            self.buckets.setdefault(key, []).append(id)
+
+    # return the ids (insertion order) of the hulls whose bounding box
+    # overlaps the given one
+    def query_ids(self, bounds):
+        ids = set()
+        for key in self.cells(bounds):
+            ids.update(self.buckets.get(key, []))
+        result = []
+        for id in sorted(ids):
+            b = self.items[id][0]
+            if b[0] <= bounds[1] and b[1] >= bounds[0] and \
+                    b[2] <= bounds[3] and b[3] >= bounds[2]:
+                result.append(id)
+        return result
+
+    # return the hulls whose bounding box overlaps the given one
+    def query(self, bounds):
+        return [ self.items[id][1] for id in self.query_ids(bounds) ]
+
+    # true if the hull overlaps any indexed hull
+    def overlaps(self, hull):
+        for other in self.query(hull.boundingBox()):
+            if other.overlaps(hull):
+                return True
+        return False
 
 
 class Sheet:
@@ -37,89 +420,297 @@ class Sheet:
         #self.ypos = 0.0 + self.step
         self.xpos = 0.0 + self.step
         #self.biggest_x = 0.0
-        self.mask = Polygon.Polygon()
+        self.placed = []        # (nest part, position) of each placed part
+        self.index = PartIndex(self.width, self.height)
+
+        # occupancy bitmap of the sheet at half step resolution (the
+        # rasterization is conservative so the extra resolution buys
+        # back the fit we would otherwise lose to it.)
+        self.cell = self.step * 0.5
+        self.occupied = np.zeros( (int(self.width / self.cell),
+                                   int(self.height / self.cell)), dtype=bool )
+
+        # skyline of the placed parts (for rectangle packing of box
+        # shaped hulls)
+        self.skyline = Skyline(self.width, self.height)
+
+        # free area bookkeeping so sheets that can't hold a part are
+        # passed over without any polygon work.  The summed area table
+        # of the occupancy bitmap is rebuilt on demand after a part is
+        # added.
+        self.free_area = self.width * self.height
+        self.free_table = None
+
+        # for the convex piece search: the cells that lie completely
+        # inside a placed hull, and the pieces of the placed parts
+        # (both brought up to date when needed)
+        self.inside = np.zeros( self.occupied.shape, dtype=bool )
+        self.inside_count = 0
+        self.placed_sat = {}
+
+        # transforms of the occupancy bitmaps (for the correlations),
+        # rebuilt on demand after they change
+        self.occupied_fft = None
+        self.inside_fft = None
 
     def draw_part_side(self, part, stroke_width="4px", color="red",
                        lines=True, points=False, outline=False, speed="fast"):
         print "Placing:", part.labels
-        if part.poly == None:
-            part.make_poly()
-        p = copy.deepcopy(part.poly)
-        p.flop(0.0)
-        bounds = p.boundingBox()
-        dx = bounds[1] - bounds[0]
-        dy = bounds[3] - bounds[2]
-        # print "dx:", dx, "dy:", dy
-
-        # make layout sheet polygon
-        sheet = Polygon.Polygon([ [0, 0],
-                                  [self.width, 0],
-                                  [self.width, self.height],
-                                  [0, self.height] ])
-        
-        if speed == "fast":
-            hull = Polygon.Polygon( [ [bounds[0], bounds[2]],
-                                      [bounds[1], bounds[2]],
-                                      [bounds[1], bounds[3]],
-                                      [bounds[0], bounds[3]] ])
-        elif speed == "medium":
-            # make convex hull outline of polygon, and make grow it a tiny bit
-            hull = Polygon.Utils.convexHull(p)
+        nest = NestPart(part, speed, self.step)
+        return self.draw_nest_part(nest, stroke_width, color, lines, points,
+                                   outline, speed)
+
+    # the svg drawing stays behind when a sheet is sent to a worker
+    # process to search for a position
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['dwg'] = None
+        return state
+
+    # find a spot for an already prepared part, and if one is found
+    # claim it and draw the part there.
+    def draw_nest_part(self, nest, stroke_width="4px", color="red",
+                       lines=True, points=False, outline=False, speed="fast"):
+        pos = self.find_position(nest, speed)
+        if pos == None:
+            return False
+        self.add_part(nest, pos)
+        self.draw_part(nest, pos, stroke_width, color, lines, points, outline)
+        return True
+
+    # search for a position for the part's hull with the strategy that
+    # matches the nesting speed/quality
+    def find_position(self, nest, speed="fast"):
+        if not self.can_hold(nest):
+            return None
+        if speed == "nfp" or speed == "holes":
+            pos = self.find_position_nfp(nest)
         elif speed == "nice":
-            # more details polygon yields better fit, but nesting takes longer
-            hull = Polygon.Utils.fillHoles(p)
+            pos = self.find_position_grid(nest)
+        elif speed == "convex":
+            pos = self.find_position_convex(nest)
         else:
-            print "ERROR: Unknown nesting speed/quality:", speed
-            print "Defaulting to 'fast'"
-            hull = Polygon.Polygon( [ [bounds[0], bounds[2]],
-                                      [bounds[1], bounds[2]],
-                                      [bounds[1], bounds[3]],
-                                      [bounds[0], bounds[3]] ])
-
-        hull.scale((dx+self.step)/dx, (dy+self.step)/dy)
-        hull180 = Polygon.Polygon(hull)
-        hull180.rotate(180.0)
-        
-        # nest the hull against the existing sheet mask
-        bestx = self.width
-        besty = self.height
+            pos = None
+            if nest.is_box:
+                pos = self.find_position_skyline(nest)
+            if pos == None:
+                # also catches gaps left under the skyline
+                pos = self.find_position_raster(nest)
+        return pos
+
+    # quick test if there is any chance to fit the part: there must be
+    # enough free area left for the hull, and an empty spot the size
+    # of the rectangle inside the hull.  (The rectangle lands at any
+    # offset so it may only cover whole cells short of two in each
+    # direction.)
+    def can_hold(self, nest):
+        if nest.hull.area() > self.free_area:
+            return False
+        (w, h) = nest.get_core(self.cell)
+        if w < 3 or h < 3:
+            return True
+        if self.free_table is None:
+            self.free_table = raster.summed_area(self.occupied)
+        return raster.has_clear_window(self.free_table, w - 2, h - 2)
+
+    # nest the hull against the existing sheet mask by trying every
+    # grid position (step spacing) and keeping the one closest to the
+    # origin.
+    def find_position_grid(self, nest):
+        # the sheet is a rectangle so the hull is covered by it exactly
+        # when its bounding box is
+        hull = nest.hull
+        hb = hull.boundingBox()
+
         best_dist = self.width + self.height
-        x = 0.0
+        x = -hb[0]
         found = False
-        while x < best_dist and x + dx + self.step < self.width:
-            x += self.step
-            y = 0.0
-            while y < best_dist and y + dy + self.step < self.height:
-                y += self.step
+        while x < best_dist and x + hb[1] <= self.width:
+            y = -hb[2]
+            while y < best_dist and y + hb[3] <= self.height:
                 bmask = Polygon.Polygon(hull)
                 bmask.shift(x, y)
-                if sheet.covers(bmask) and not self.mask.overlaps(bmask):
+                if not self.index.overlaps(bmask):
                     found = True
                     dist = math.sqrt(x*x + y*y)
                     if dist < best_dist:
                         best_x = x
                         best_y = y
                         best_dist = dist
+                y += self.step
+            x += self.step
 
         if not found:
-            return False
+            return None
+        return (best_x, best_y)
 
-        # create and position the shape mask in the 'best' position.
-        bmask = Polygon.Polygon(hull)
-        bmask.shift(best_x, best_y)
+    # compute the no-fit polygon of the hull against every part
+    # already on the sheet, subtract those from the inner-fit
+    # rectangle of the sheet, and pick the feasible vertex closest to
+    # the origin.  Parts end up in exact contact (one step apart)
+    # rather than snapped to the grid.
+    def find_position_nfp(self, nest):
+        feasible = nfp.inner_fit_rect(nest.hull.boundingBox(),
+                                      self.width, self.height)
+        if feasible == None:
+            return None
+        for (other, pos) in self.placed:
+            key = (other.key, nest.key)
+            if key not in nfp_cache:
+                if len(nfp_cache) >= nfp_cache_size:
+                    nfp_cache.clear()
+                nfp_cache[key] = nfp.no_fit_polygon(other.get_pieces(),
+                                                    nest.get_neg_pieces())
+            forbidden = Polygon.Polygon(nfp_cache[key])
+            forbidden.shift(pos[0], pos[1])
+            feasible = feasible - forbidden
+            if len(feasible) == 0:
+                return None
+
+        # verify against the neighboring hulls (guards against
+        # numerical slop in the no-fit polygon math)
+        tolerance = nest.hull.area() * 1e-9
+        for (x, y) in nfp.candidate_positions(feasible):
+            bmask = Polygon.Polygon(nest.hull)
+            bmask.shift(x, y)
+            overlap = 0.0
+            for other in self.index.query(bmask.boundingBox()):
+                overlap += (other & bmask).area()
+            if overlap <= tolerance:
+                return (x, y)
+        return None
+
+    # correlate the hull bitmap against the sheet occupancy bitmap to
+    # find every collision free cell offset at once, then pick the one
+    # closest to the origin (same rule as the grid search.)
+    def find_position_raster(self, nest):
+        (bitmap, i0, j0) = nest.get_bitmap(self.cell)
+        if self.occupied_fft is None:
+            self.occupied_fft = raster.spectrum(self.occupied)
+        counts = raster.overlap_counts(self.occupied, bitmap,
+                                       self.occupied_fft)
+        if counts.size == 0:
+            return None
+        (u, v) = np.nonzero(counts < 0.5)
+        if len(u) == 0:
+            return None
+        x = (u - i0) * self.cell
+        y = (v - j0) * self.cell
+        i = np.argmin(np.hypot(x, y))
+        return (x[i], y[i])
+
+    # positions where the hull bitmap misses every occupied cell are
+    # free for sure, positions where it touches a cell lying completely
+    # inside a placed hull are blocked for sure.  Only the uncertain
+    # positions closer to the origin than the closest sure one need
+    # the exact test: a separating axis check of the convex pieces of
+    # the hull against the pieces of its neighbors, a batch of
+    # positions at a time.
+    def find_position_convex(self, nest):
+        (bitmap, i0, j0) = nest.get_bitmap(self.cell)
+        (nx, ny) = self.occupied.shape
+        (w, h) = bitmap.shape
+        if w > nx or h > ny:
+            return None
+        fp = raster.spectrum(np.pad(bitmap, ( (0, nx - w), (0, ny - h) ),
+                                    'constant'))
+        if self.occupied_fft is None:
+            self.occupied_fft = raster.spectrum(self.occupied)
+        counts = raster.overlap_counts(self.occupied, bitmap,
+                                       self.occupied_fft, fp)
+        free = counts < 0.5
+        x = (np.arange(counts.shape[0]) - i0) * self.cell
+        y = (np.arange(counts.shape[1]) - j0) * self.cell
+        dist = np.hypot(x[:,np.newaxis], y[np.newaxis,:])
+        sure = None
+        if free.any():
+            sure = np.unravel_index(np.argmin(np.where(free, dist, np.inf)),
+                                    dist.shape)
+            maybe = ~free & (dist < dist[sure])
+        else:
+            maybe = ~free
+        if maybe.any():
+            while self.inside_count < len(self.placed):
+                (other, pos) = self.placed[self.inside_count]
+                hull = Polygon.Polygon(other.hull)
+                hull.shift(pos[0], pos[1])
+                (inside, a0, b0) = raster.interior(hull, self.cell)
+                raster.paste(self.inside, 0, 0, inside, a0, b0, True)
+                self.inside_count += 1
+                self.inside_fft = None
+            if self.inside_fft is None:
+                self.inside_fft = raster.spectrum(self.inside)
+            hits = raster.overlap_counts(self.inside, bitmap,
+                                         self.inside_fft, fp)
+            maybe &= hits < 0.5
+        (u, v) = np.nonzero(maybe)
+        order = np.argsort(dist[u, v], kind='mergesort')
+        u = u[order]
+        v = v[order]
+
+        moving = nest.get_sat()
+        hb = nest.hull.boundingBox()
+        for k in range(0, len(u), 64):
+            pos = np.column_stack( (x[u[k:k+64]], y[v[k:k+64]]) )
+            bounds = (hb[0] + pos[:,0].min(), hb[1] + pos[:,0].max(),
+                      hb[2] + pos[:,1].min(), hb[3] + pos[:,1].max())
+            ids = self.index.query_ids(bounds)
+            if len(ids) == 0:
+                return (pos[0][0], pos[0][1])
+            bad = sat.blocked(moving, self.get_placed_sat(ids), pos)
+            if not bad.all():
+                i = np.argmin(bad)
+                return (pos[i][0], pos[i][1])
+        if sure != None:
+            return (x[sure[0]], y[sure[1]])
+        return None
+
+    # the convex pieces of the placed parts with the given ids, at
+    # their positions on the sheet
+    def get_placed_sat(self, ids):
+        sets = []
+        for id in ids:
+            if id not in self.placed_sat:
+                (other, pos) = self.placed[id]
+                (verts, normals) = other.get_sat()
+                self.placed_sat[id] = (verts + np.array(pos), normals)
+            sets.append(self.placed_sat[id])
+        return sat.combine(sets)
 
-        # merge bounds mask into sheet mask
-        self.mask += bmask
+    # drop the hull's bounding rectangle onto the skyline
+    def find_position_skyline(self, nest):
+        bounds = nest.hull.boundingBox()
+        corner = self.skyline.find(bounds[1] - bounds[0], bounds[3] - bounds[2])
+        if corner == None:
+            return None
+        return (corner[0] - bounds[0], corner[1] - bounds[2])
 
-        #Polygon.IO.writeGnuplotTriangles("mask.plt", [self.mask])
-        #result = raw_input("press enter to continue:")
-        
+    # claim the space used by a part at the given position
+    def add_part(self, nest, pos):
+        # create and position the shape mask in the 'best' position.
+        bmask = Polygon.Polygon(nest.hull)
+        bmask.shift(pos[0], pos[1])
+        self.placed.append( (nest, pos) )
+        self.index.insert(bmask)
+        raster.stamp(self.occupied, bmask, self.cell)
+        self.free_area -= bmask.area()
+        self.free_table = None
+        self.occupied_fft = None
+        bounds = bmask.boundingBox()
+        self.skyline.add(bounds[0], bounds[1], bounds[3])
+
+    def draw_part(self, nest, pos, stroke_width="4px", color="red",
+                  lines=True, points=False, outline=False):
+        part = nest.part
         g = self.dwg.g()
         #g.translate((x-bounds[0])*self.dpi,
         #            (y-bounds[2])*self.dpi)
-        g.translate((best_x)*self.dpi,
-                    (best_y)*self.dpi)
+        g.translate((pos[0])*self.dpi,
+                    (pos[1])*self.dpi)
+        if nest.angle != 0.0:
+            g.rotate(nest.angle)
 
+        p = copy.deepcopy(nest.poly)
         p.scale( self.dpi, self.dpi, 0.0, 0.0 )
 
         if outline:
@@ -244,9 +835,32 @@ class Sheet:
         self.dwg.save()
 
 
+# search one sheet for one orientation of a part (module level so it
+# can run in a worker process)
+def find_position(args):
+    (sheet, nest, speed) = args
+    return sheet.find_position(nest, speed)
+
+# rank placements of different orientations of a part: the one whose
+# hull ends up closest to the sheet origin wins
+def placement_dist(nest, pos):
+    bounds = nest.hull.boundingBox()
+    x = pos[0] + (bounds[0] + bounds[1]) * 0.5
+    y = pos[1] + (bounds[2] + bounds[3]) * 0.5
+    return math.sqrt(x*x + y*y)
+
+
 class Layout:
 
-    def __init__(self, basename, width, height, step=None, units="in", dpi=90):
+    # orientations: list of part rotations (degrees) to try when
+    # nesting, i.e. (0, 180) or (0, 90, 180, 270).  workers: number
+    # of processes to search orientations in parallel (default 1 =
+    # search in this process.  The pool is kept until close() or
+    # save() is called.)  cache_dir: directory of
+    # the on-disk nesting cache (see nestcache.py, default is no
+    # cache.)
+    def __init__(self, basename, width, height, step=None, units="in", dpi=90,
+                 orientations=None, workers=1, cache_dir=None):
         self.basename = basename
         self.width = width
         self.height = height
@@ -264,15 +878,105 @@ class Layout:
                 self.step = 0.1
         self.dpi = dpi
         self.sheets = []
+        if orientations != None:
+            self.orientations = orientations
+        else:
+            self.orientations = (0.0, 180.0)
+        self.workers = workers
+        self.pool = None
+        self.nest_cache = {}    # shape key -> prepared nest parts
+        self.stack_cache = {}   # (key, key) -> stacking offset
+        self.cache_dir = cache_dir
+        self.drawn = []         # (part, sheet, angle, pos) of each drawn part
+
+    # prepare a nest part for each orientation (dropping orientations
+    # that don't fit on a sheet, and box hulls that duplicate the size
+    # of an earlier orientation.)  Parts with the same shape as an
+    # earlier part share its nest parts.
+    def make_nest_parts(self, part, speed):
+        if part.poly == None:
+            part.make_poly()
+        key = (shape_key(part.poly), speed)
+        if key in self.nest_cache:
+            return [ nest.copy_for(part) for nest in self.nest_cache[key] ]
+        nests = []
+        sizes = []
+        for angle in self.orientations:
+            nest = NestPart(part, speed, self.step, float(angle) % 360.0)
+            if (nest.dx > self.width - 2*self.step) or \
+                    (nest.dy > self.height - 2*self.step):
+                continue
+            size = ( round(nest.dx, 6), round(nest.dy, 6) )
+            if nest.is_box and size in sizes:
+                continue
+            sizes.append(size)
+            nest.prepare(speed, self.step * 0.5)
+            nests.append(nest)
+        self.nest_cache[key] = nests
+        return nests
+
+    # search a sheet with every orientation of the part that it has
+    # room for and return the
+    # best (nest, pos) or None.  The expensive polygon searches are
+    # farmed out to the worker pool, the fast ones aren't worth the
+    # trip.
+    def find_best(self, sheet, nests, speed):
+        nests = [ nest for nest in nests if sheet.can_hold(nest) ]
+        if len(nests) == 0:
+            return None
+        jobs = [ (sheet, nest, speed) for nest in nests ]
+        if len(jobs) > 1 and self.workers > 1 and \
+                (speed == "nice" or speed == "nfp" or speed == "holes"):
+            if self.pool == None:
+                self.pool = multiprocessing.Pool(self.workers)
+            results = self.pool.map(find_position, jobs)
+        else:
+            results = map(find_position, jobs)
+        best = None
+        best_dist = None
+        for nest, pos in zip(nests, results):
+            if pos == None:
+                continue
+            dist = placement_dist(nest, pos)
+            if best_dist == None or dist < best_dist:
+                best = (nest, pos)
+                best_dist = dist
+        return best
+
+    # place one of the prepared nest parts (orientations) of a part on
+    # the first sheet with room for it, starting a new sheet if none
+    # has.  Returns (sheet, nest, pos), or None if it didn't fit.  Only
+    # the space is claimed, nothing is drawn.
+    def place(self, nests, speed):
+        num_sheets = len(self.sheets)
+        i = 0
+        best = None
+        while i < num_sheets and best == None:
+            sheet = self.sheets[i]
+            best = self.find_best(sheet, nests, speed)
+            i += 1
+        if best == None:
+            # couldn't fit on any existing sheet so create a new one
+            sheet = Sheet(self.basename + str(i), self.width, self.height,
+                          step=self.step, units=self.units, dpi=self.dpi)
+            best = self.find_best(sheet, nests, speed)
+            self.sheets.append(sheet)
+        if best == None:
+            return None
+        (nest, pos) = best
+        sheet.add_part(nest, pos)
+        return (sheet, nest, pos)
 
+    # angles: only try these orientations of the part (default is all
+    # the layout orientations)
     def draw_part(self, part, stroke_width="1px", color="red", lines=False,
-                  points=False, outline=False, speed="fast" ):
+                  points=False, outline=False, speed="fast", angles=None ):
         # sanity check that part will fit on a sheet
         bounds = part.get_bounds()
         dx = bounds[1][0] - bounds[0][0]
         dy = bounds[1][1] - bounds[0][1]
-        if (dx > self.width - 2*self.step) or \
-                (dy > self.height - 2*self.step):
+        nests = self.make_nest_parts(part, speed)
+        if len(nests) == 0:
             if len(part.labels):
                 print "Failed to fit: " + part.labels[0][4]
             else:
@@ -281,20 +985,18 @@ class Layout:
                 + ") exceed size of sheet (" + str(self.width) + "x" \
                 + str(self.height) + self.units +")"
             return False
-        num_sheets = len(self.sheets)
-        i = 0
-        done = False
-        while i < num_sheets and not done:
-            done = self.sheets[i].draw_part_side(part, stroke_width, color,
-                                                 lines, points, outline, speed)
-            i += 1
-        if not done:
-            # couldn't fit on any existing sheet so create a new one
-            sheet = Sheet(self.basename + str(i), self.width, self.height,
-                          step=self.step, units=self.units, dpi=self.dpi)
-            done = sheet.draw_part_side(part, stroke_width, color, lines,
-                                        points, outline, speed)
-            self.sheets.append(sheet)
+        if angles != None:
+            chosen = [ nest for nest in nests if nest.angle in angles ]
+            if len(chosen):
+                nests = chosen
+        print "Placing:", part.labels
+        placed = self.place(nests, speed)
+        done = placed != None
+        if done:
+            (sheet, nest, pos) = placed
+            sheet.draw_part(nest, pos, stroke_width, color, lines, points,
+                            outline)
+            self.drawn.append( (part, sheet, nest.angle, pos) )
         if not done:
             print "this should never happen!"
             if len(part.labels):
@@ -303,9 +1005,263 @@ class Layout:
                 print "Failed to fit: " + part.name
         return done
 
-    def draw_part_cut_line(self, airfoil, speed):
-        self.draw_part(airfoil, stroke_width=".05mm", color="red", lines=True,
-                       speed=speed)
+    # offset that stacks nest part b right next to nest part a along
+    # the short side of a (with their edges lined up), as close as the
+    # no-fit polygon of the two allows.
+    def stack_offset(self, a, b):
+        key = (a.key, b.key)
+        if key in self.stack_cache:
+            return self.stack_cache[key]
+        ba = a.hull.boundingBox()
+        bb = b.hull.boundingBox()
+        forbidden = nfp.no_fit_polygon(a.get_pieces(), b.get_neg_pieces())
+        fb = forbidden.boundingBox()
+        eps = 1e-6 * ((fb[1] - fb[0]) + (fb[3] - fb[2]))
+        if ba[1] - ba[0] >= ba[3] - ba[2]:
+            # stack upwards
+            x = ba[0] - bb[0]
+            line = Polygon.Polygon( [ (x - eps, fb[2]), (x + eps, fb[2]),
+                                      (x + eps, fb[3]), (x - eps, fb[3]) ] )
+            cut = forbidden & line
+            if len(cut):
+                offset = (x, cut.boundingBox()[3])
+            else:
+                offset = (x, ba[3] - bb[2])
+        else:
+            # stack to the right
+            y = ba[2] - bb[2]
+            line = Polygon.Polygon( [ (fb[0], y - eps), (fb[1], y - eps),
+                                      (fb[1], y + eps), (fb[0], y + eps) ] )
+            cut = forbidden & line
+            if len(cut):
+                offset = (cut.boundingBox()[1], y)
+            else:
+                offset = (ba[1] - bb[0], y)
+        self.stack_cache[key] = offset
+        return offset
+
+    # stack a list of parts: returns a list of stack members [ (nest
+    # part, offset) ] for each orientation that every part can use
+    def stack_parts(self, parts, speed):
+        by_angle = []
+        for part in parts:
+            nests = self.make_nest_parts(part, speed)
+            by_angle.append( dict( [ (nest.angle, nest) for nest in nests ] ) )
+        stacks = []
+        for angle in self.orientations:
+            angle = float(angle) % 360.0
+            if len( [ d for d in by_angle if angle not in d ] ):
+                continue
+            members = []
+            offset = (0.0, 0.0)
+            prev = None
+            for d in by_angle:
+                nest = d[angle]
+                if prev != None:
+                    t = self.stack_offset(prev, nest)
+                    offset = (offset[0] + t[0], offset[1] + t[1])
+                members.append( (nest, offset) )
+                prev = nest
+            stacks.append(members)
+        return stacks
+
+    # number of leading stack members that fit on a sheet together
+    def stack_fit(self, members):
+        count = 0
+        extent = None
+        for (nest, offset) in members:
+            b = nest.hull.boundingBox()
+            b = (b[0] + offset[0], b[1] + offset[0], b[2] + offset[1],
+                 b[3] + offset[1])
+            if extent == None:
+                extent = b
+            else:
+                extent = (min(extent[0], b[0]), max(extent[1], b[1]),
+                          min(extent[2], b[2]), max(extent[3], b[3]))
+            if (extent[1] - extent[0] > self.width - self.step) or \
+                    (extent[3] - extent[2] > self.height - self.step):
+                break
+            count += 1
+        return count
+
+    # try to place the leading parts of the list as one stack on an
+    # existing sheet (halving the stack until it fits somewhere.)
+    # Returns the number of parts placed.
+    def draw_stack(self, parts, stroke_width="1px", color="red", lines=False,
+                   points=False, outline=False, speed="fast"):
+        stacks = self.stack_parts(parts, speed)
+        if len(stacks) == 0:
+            return 0
+        n = len(parts)
+        for members in stacks:
+            n = min(n, self.stack_fit(members))
+        while n >= 2:
+            groups = []
+            for members in stacks:
+                group = NestGroup(members[:n], self.step)
+                area = 0.0
+                for (nest, offset) in members[:n]:
+                    area += nest.hull.area()
+                # members further apart than neighbors could still
+                # collide for odd shapes, skip those stacks
+                if math.fabs(group.hull.area() - area) <= 1e-6 * area:
+                    groups.append(group)
+            for sheet in self.sheets:
+                best = self.find_best(sheet, groups, speed)
+                if best == None:
+                    continue
+                (group, pos) = best
+                for (nest, offset) in group.members:
+                    print "Placing:", nest.part.labels
+                    p = (pos[0] + offset[0], pos[1] + offset[1])
+                    sheet.add_part(nest, p)
+                    sheet.draw_part(nest, p, stroke_width, color, lines,
+                                    points, outline)
+                    self.drawn.append( (nest.part, sheet, nest.angle, p) )
+                return n
+            n /= 2
+        return 0
+
+    # nest a list of parts.  Identical parts (and mirror twins, which
+    # are alternated) are found by their shape fingerprint and, at the
+    # nice and medium speeds, placed together as stacks, one search
+    # per stack instead of one per part.  Returns the list of placed
+    # flags.
+    def draw_parts(self, parts, stroke_width="1px", color="red", lines=False,
+                   points=False, outline=False, speed="fast"):
+        families = []
+        index = {}
+        for i, part in enumerate(parts):
+            if part.poly == None:
+                part.make_poly()
+            (key, mirror_key) = shape_fingerprint(part.poly)
+            if key in index:
+                (family, side) = index[key]
+            else:
+                family = ( [], [] )
+                families.append(family)
+                side = 0
+                index[key] = (family, 0)
+                if mirror_key != key:
+                    index[mirror_key] = (family, 1)
+            family[side].append(i)
+
+        placed = [ False ] * len(parts)
+        for (same, mirrored) in families:
+            remaining = []
+            for i in range(max(len(same), len(mirrored))):
+                if i < len(same):
+                    remaining.append(same[i])
+                if i < len(mirrored):
+                    remaining.append(mirrored[i])
+            while len(remaining):
+                count = 0
+                # (stacks only pay off for the nice and medium
+                # speeds: fast and convex place a part quicker than
+                # a stack is built, and no-fit polygon nesting
+                # already reuses its work for identical parts through
+                # the nfp cache, which a stack would only defeat)
+                if len(remaining) > 1 and \
+                        (speed == "nice" or speed == "medium"):
+                    count = self.draw_stack( [ parts[i] for i in remaining ],
+                                             stroke_width, color, lines,
+                                             points, outline, speed )
+                if count == 0:
+                    # on its own (this also starts new sheets)
+                    i = remaining[0]
+                    placed[i] = self.draw_part(parts[i], stroke_width, color,
+                                               lines, points, outline, speed)
+                    count = 1
+                else:
+                    for i in remaining[:count]:
+                        placed[i] = True
+                remaining = remaining[count:]
+        return placed
+
+    # the nesting cache key of a list of parts (in placement order):
+    # the part shapes plus everything else that decides where they end
+    # up, including the version of the nesting code (extra is anything
+    # the caller adds to that.)
+    def cache_key(self, parts, speed, extra=None):
+        fields = [ nestcache.version,
+                   self.width, self.height, self.step, self.units,
+                   [ float(angle) % 360.0 for angle in self.orientations ],
+                   speed, extra ]
+        for part in parts:
+            if part.poly == None:
+                part.make_poly()
+            fields.append( shape_key(part.poly) )
+        return nestcache.fingerprint(fields)
+
+    # draw a list of parts where the nesting cache has them.  Returns
+    # the list of placed flags, or None when the cache has no entry
+    # for the parts (nothing is drawn then.)  The cached parts are
+    # added to the sheets like nested ones, so more parts can still be
+    # nested around them afterwards.
+    def draw_cached(self, parts, stroke_width="1px", color="red", lines=False,
+                    points=False, outline=False, speed="fast", extra=None):
+        if self.cache_dir == None:
+            return None
+        data = nestcache.load(self.cache_dir,
+                              self.cache_key(parts, speed, extra))
+        if data == None:
+            return None
+        placed = [ False ] * len(parts)
+        nests = {}
+        for (i, index, angle, pos) in data:
+            while len(self.sheets) <= index:
+                self.sheets.append( Sheet(self.basename + str(len(self.sheets)),
+                                          self.width, self.height,
+                                          step=self.step, units=self.units,
+                                          dpi=self.dpi) )
+            sheet = self.sheets[index]
+            # (identical parts share the hull, like make_nest_parts())
+            part = parts[i]
+            if part.poly == None:
+                part.make_poly()
+            key = (shape_key(part.poly), angle)
+            if key not in nests:
+                nests[key] = NestPart(part, speed, self.step, angle)
+            nest = nests[key].copy_for(part)
+            pos = tuple(pos)
+            sheet.add_part(nest, pos)
+            sheet.draw_part(nest, pos, stroke_width, color, lines, points,
+                            outline)
+            self.drawn.append( (parts[i], sheet, angle, pos) )
+            placed[i] = True
+        print "Drew", len(data), "parts from the nesting cache"
+        return placed
+
+    # save where the parts (the same list as passed to draw_cached)
+    # were drawn in the nesting cache
+    def store_cached(self, parts, speed="fast", extra=None):
+        if self.cache_dir == None:
+            return
+        # the same part can be in the list more than once (copies)
+        indices = {}
+        for i, part in enumerate(parts):
+            indices.setdefault(id(part), []).append(i)
+        data = []
+        for (part, sheet, angle, pos) in self.drawn:
+            if len(indices.get(id(part), [])) == 0:
+                continue
+            i = indices[id(part)].pop(0)
+            data.append( (i, self.sheets.index(sheet), angle,
+                          (float(pos[0]), float(pos[1]))) )
+        nestcache.store(self.cache_dir, self.cache_key(parts, speed, extra),
+                        data)
+
+    def draw_cached_cut_line(self, airfoils, speed, extra=None):
+        return self.draw_cached(airfoils, stroke_width=".05mm", color="red",
+                                lines=True, speed=speed, extra=extra)
+
+    def draw_parts_cut_line(self, airfoils, speed):
+        return self.draw_parts(airfoils, stroke_width=".05mm", color="red",
+                               lines=True, speed=speed)
+
+    def draw_part_cut_line(self, airfoil, speed, angles=None):
+        return self.draw_part(airfoil, stroke_width=".05mm", color="red",
+                              lines=True, speed=speed, angles=angles)
 
     def draw_part_plan_side(self, airfoil, speed):
         self.draw_part(airfoil, stroke_width="1px", color="red", lines=True,
@@ -319,6 +1275,14 @@ class Layout:
         self.draw_part(airfoil, stroke_width="1px", color="red", points=True,
                        speed=speed)
 
+    # shut down the worker pool (if one was started)
+    def close(self):
+        if self.pool != None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
     def save(self):
+        self.close()
         for sheet in self.sheets:
             sheet.save()
@@ -0,0 +1,90 @@
+# nestcache.py - on-disk cache of nesting results
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# A nesting result is stored as a small json file named by the
+# fingerprint of everything the nesting depends on, so a rebuild of an
+# unchanged kit can draw its sheets straight from the cache.  Reading
+# an entry marks it as recently used, and the least recently used
+# entries are evicted when the cache grows past cache_size bytes.
+
+import hashlib
+import json
+import os
+
+
+cache_size = 10 * 1024 * 1024
+
+# the version of the nesting code and entry format, part of every key.
+# Bump it whenever the placement logic (hull growth, stacking, the
+# no-fit polygons, ...) or the entry format changes so old entries are
+# no longer used.
+version = 3
+
+# md5 hex digest of a list of fields (anything with a stable repr)
+def fingerprint(fields):
+    h = hashlib.md5()
+    for field in fields:
+        h.update(repr(field))
+    return h.hexdigest()
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key + ".json")
+
+# the cached data for a key, or None
+def load(cache_dir, key):
+    path = entry_path(cache_dir, key)
+    try:
+        f = open(path, 'r')
+        data = json.load(f)
+        f.close()
+    except (IOError, ValueError):
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return data
+
+# store the data for a key (then evict the oldest entries if the cache
+# got too big)
+def store(cache_dir, key, data):
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        path = entry_path(cache_dir, key)
+        tmp = path + ".tmp"
+        f = open(tmp, 'w')
+        json.dump(data, f)
+        f.close()
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        print "Unable to write nesting cache entry: " + key
+        return
+    evict(cache_dir, cache_size)
+
+# remove the least recently used entries until the cache holds at most
+# max_size bytes
+def evict(cache_dir, max_size):
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append( (st.st_mtime, st.st_size, path) )
+        total += st.st_size
+    entries.sort()
+    for (mtime, size, path) in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
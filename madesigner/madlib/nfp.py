@@ -0,0 +1,173 @@
+# nfp.py - no-fit polygon helpers for sheet nesting
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# The no-fit polygon (nfp) of a fixed shape A and a moving shape B is
+# the set of translations of B that make B overlap A.  For convex
+# shapes this is simply the minkowski sum A + (-B).  General
+# (non-convex) parts are decomposed into a small set of convex pieces
+# and the nfp is the union of the nfp's of every piece pair.
+
+import math
+import numpy as np
+import Polygon
+
+
+# convex hull of a set of points (monotone chain), returned as a
+# counter clockwise numpy array
+def convex_hull(points):
+    pts = sorted(set( [ (p[0], p[1]) for p in points ] ))
+    if len(pts) < 3:
+        return np.array(pts, dtype=float)
+    def cross(o, a, b):
+        return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return np.array(lower[:-1] + upper[:-1], dtype=float)
+
+# for each point, the distance inwards from the boundary of a convex
+# (counter clockwise) hull.  This is how deep a vertex sits in a
+# concavity of the shape it belongs to.
+def hull_depth(hull, points):
+    edges = np.roll(hull, -1, axis=0) - hull
+    lengths = np.hypot(edges[:,0], edges[:,1])
+    keep = lengths > 1e-12
+    hull = hull[keep]
+    edges = edges[keep] / lengths[keep][:,np.newaxis]
+    rel_x = points[:,0][:,np.newaxis] - hull[:,0]
+    rel_y = points[:,1][:,np.newaxis] - hull[:,1]
+    dist = edges[:,0]*rel_y - edges[:,1]*rel_x
+    return np.min(dist, axis=1)
+
+# split a Polygon into a small list of convex pieces (counter
+# clockwise numpy arrays) that together cover the polygon.  Any piece
+# whose concavities are shallower than 'tolerance' is replaced by its
+# convex hull, otherwise it is cut in two through its deepest vertex
+# and each half is processed again.  Holes deeper than the tolerance
+# are honored the same way.
+def convex_pieces(poly, tolerance=0.0, max_pieces=64):
+    result = []
+    work = [ Polygon.Polygon(poly) ]
+    while len(work):
+        piece = work.pop()
+        points = []
+        for c in piece:
+            points += c
+        if len(points) < 3:
+            continue
+        points = np.array(points, dtype=float)
+        hull = convex_hull(points)
+        if len(hull) < 3:
+            continue
+        depth = hull_depth(hull, points)
+        i = np.argmax(depth)
+        if depth[i] <= tolerance or len(result) + len(work) >= max_pieces:
+            result.append(hull)
+            continue
+        # cut through the deepest vertex (vertically if we can,
+        # otherwise horizontally)
+        xmin, xmax, ymin, ymax = piece.boundingBox()
+        x, y = points[i]
+        pad = (xmax - xmin) + (ymax - ymin)
+        if x - xmin > 1e-9 and xmax - x > 1e-9:
+            cut1 = Polygon.Polygon( [ (xmin-pad, ymin-pad), (x, ymin-pad),
+                                      (x, ymax+pad), (xmin-pad, ymax+pad) ] )
+        elif y - ymin > 1e-9 and ymax - y > 1e-9:
+            cut1 = Polygon.Polygon( [ (xmin-pad, ymin-pad), (xmax+pad, ymin-pad),
+                                      (xmax+pad, y), (xmin-pad, y) ] )
+        else:
+            result.append(hull)
+            continue
+        for half in (piece & cut1, piece - cut1):
+            # separate disjoint regions (keeping holes with the
+            # outline that encloses them)
+            for i, c in enumerate(half):
+                if half.isHole(i):
+                    continue
+                region = Polygon.Polygon(c)
+                for j, h in enumerate(half):
+                    if half.isHole(j) and region.isInside(h[0][0], h[0][1]):
+                        region.addContour(h, 1)
+                if region.area() > 1e-12:
+                    work.append(region)
+    return result
+
+# prepare a convex (counter clockwise) piece for minkowski sums:
+# start at the lowest vertex and precompute the edge vectors and their
+# polar angles (which are then sorted.)
+def prepare_piece(c):
+    c = np.asarray(c, dtype=float)
+    i = np.lexsort( (c[:,0], c[:,1]) )[0]
+    c = np.concatenate( (c[i:], c[:i]) )
+    edges = np.concatenate( (c[1:], c[:1]) ) - c
+    angles = np.mod(np.arctan2(edges[:,1], edges[:,0]), 2.0*math.pi)
+    return (c[0], edges, angles)
+
+# minkowski sum of two prepared convex pieces (O(n+m) merge of the
+# edge vectors by polar angle)
+def minkowski_sum(a, b):
+    edges = np.concatenate( (a[1], b[1]) )
+    angles = np.concatenate( (a[2], b[2]) )
+    order = np.argsort(angles, kind='mergesort')
+    pts = np.cumsum(edges[order], axis=0)
+    pts[-1] = 0.0
+    return np.roll(pts, 1, axis=0) + (a[0] + b[0])
+
+# union a list of polygons (balanced pairwise so we don't keep
+# clipping against one ever growing result)
+def union_all(polys):
+    if len(polys) == 0:
+        return Polygon.Polygon()
+    while len(polys) > 1:
+        merged = []
+        for i in range(0, len(polys) - 1, 2):
+            merged.append(polys[i] + polys[i+1])
+        if len(polys) % 2:
+            merged.append(polys[-1])
+        polys = merged
+    return polys[0]
+
+# no-fit polygon of a fixed set of convex pieces and a moving set of
+# convex pieces: the region of translations for the moving part's
+# reference point that cause an overlap.  Pieces must be prepared
+# with prepare_piece(), the moving pieces mirrored through the origin.
+def no_fit_polygon(fixed_pieces, moving_pieces):
+    shapes = []
+    for b in moving_pieces:
+        for a in fixed_pieces:
+            shapes.append( Polygon.Polygon(minkowski_sum(a, b).tolist()) )
+    return union_all(shapes)
+
+# inner-fit rectangle: the translations that keep a shape with the
+# given bounding box (xmin, xmax, ymin, ymax) inside a width x height
+# sheet.  Returns None if the shape can't fit at all.
+def inner_fit_rect(bounds, width, height):
+    x1 = -bounds[0]
+    x2 = width - bounds[1]
+    y1 = -bounds[2]
+    y2 = height - bounds[3]
+    if x2 < x1 or y2 < y1:
+        return None
+    return Polygon.Polygon( [ (x1, y1), (x2, y1), (x2, y2), (x1, y2) ] )
+
+# return the vertices of the feasible region sorted by distance from
+# the sheet origin (closest first.)
+def candidate_positions(feasible):
+    pts = []
+    for c in feasible:
+        pts += c
+    if len(pts) == 0:
+        return []
+    a = np.array(pts)
+    dist = np.hypot(a[:,0], a[:,1])
+    order = np.argsort(dist, kind='mergesort')
+    return [ (a[i][0], a[i][1]) for i in order ]
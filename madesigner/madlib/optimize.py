@@ -0,0 +1,198 @@
+# optimize.py - search for a better nesting order and orientations
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# The greedy layout places the parts largest first, each in its best
+# orientation.  That is quick, but it isn't always the fewest sheets.
+# The optimizer anneals the placement order and the orientation of
+# each part: every round a batch of variations of the current layout
+# is scored in parallel (one complete nesting run each, nothing drawn)
+# and the best one found when the time budget runs out is returned.
+# Since the greedy layout is scored first the result is never worse.
+
+import math
+import multiprocessing
+import random
+import time
+
+import layout
+import nestcache
+
+
+# the nesting job (sheet size, speed and the prepared nest parts) set
+# once in each worker process
+job = None
+
+def set_job(args):
+    global job
+    job = args
+
+# nest the parts in the order and orientations of a candidate and
+# score the result: the number of sheets plus the used fraction of the
+# last sheet (lower is better.)  A candidate is (order, choice) where
+# choice[i] is the index of the orientation to use for part i, or -1
+# to pick the best one at each placement.
+def evaluate(candidate):
+    (width, height, step, units, speed, nests) = job
+    (order, choice) = candidate
+    l = layout.Layout("", width, height, step=step, units=units, workers=1)
+    failed = 0
+    for i in order:
+        options = nests[i]
+        if choice[i] >= 0:
+            options = [ options[choice[i]] ]
+        if l.place(options, speed) == None:
+            failed += 1
+    if len(l.sheets) == 0:
+        return 0.0
+    last = l.sheets[-1]
+    used = 1.0 - last.free_area / (last.width * last.height)
+    return failed * 1000.0 + len(l.sheets) + used
+
+# a random variation of a candidate: swap two parts, move a part to
+# another spot in the order, or change the orientation of a part
+def mutate(candidate, nests, rng):
+    order = list(candidate[0])
+    choice = list(candidate[1])
+    n = len(order)
+    r = rng.random()
+    if r < 0.4 and n > 1:
+        (i, j) = rng.sample(range(n), 2)
+        (order[i], order[j]) = (order[j], order[i])
+    elif r < 0.7 and n > 1:
+        part = order.pop(rng.randrange(n))
+        order.insert(rng.randrange(n), part)
+    else:
+        i = order[rng.randrange(n)]
+        choice[i] = rng.randrange(-1, len(nests[i]))
+    return (order, choice)
+
+# search for a better placement of the parts (in greedy order) on the
+# sheets of layout l for 'budget' seconds.  Returns the list of (part
+# index, angles) in the order to place them, where angles is the
+# orientation to use (or None for the best one at the time.)
+def optimize_layout(l, parts, speed, budget, workers=None, seed=0):
+    nests = [ l.make_nest_parts(part, speed) for part in parts ]
+    keep = [ i for i in range(len(parts)) if len(nests[i]) ]
+    current = (keep, [-1] * len(parts))
+    data = (l.width, l.height, l.step, l.units, speed, nests)
+    if workers == None:
+        workers = l.workers
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=set_job,
+                                    initargs=(data,))
+        evaluate_all = pool.map
+    else:
+        set_job(data)
+        evaluate_all = map
+
+    try:
+        rng = random.Random(seed)
+        start = time.time()
+        current_score = evaluate_all(evaluate, [current])[0]
+        greedy_score = current_score
+        best = current
+        best_score = current_score
+        rounds = 0
+        while len(keep) > 1 and time.time() - start < budget:
+            # cool down over the time budget
+            temp = 0.05 * (1.0 - (time.time() - start) / budget)
+            batch = [ mutate(current, nests, rng) for i in range(workers) ]
+            scores = evaluate_all(evaluate, batch)
+            k = scores.index(min(scores))
+            delta = scores[k] - current_score
+            if delta <= 0.0 or \
+                    (temp > 0.0 and rng.random() < math.exp(-delta / temp)):
+                current = batch[k]
+                current_score = scores[k]
+                if current_score < best_score:
+                    best = current
+                    best_score = current_score
+            rounds += 1
+    finally:
+        if pool != None:
+            pool.close()
+            pool.join()
+    print "Optimized layout: score", best_score, "greedy", greedy_score, \
+        "(" + str(rounds) + " rounds)"
+
+    (order, choice) = best
+    result = []
+    for i in order:
+        angles = None
+        if choice[i] >= 0:
+            angles = ( nests[i][choice[i]].angle, )
+        result.append( (i, angles) )
+    return result
+
+# nest the parts (a list of prepared nest parts for each part, in
+# placement order) on sheets of one stock size without drawing.
+# Returns (number of sheets, number of parts that didn't fit.)
+def evaluate_stock(size):
+    (step, units, speed, nests) = job
+    (width, height) = size
+    l = layout.Layout("", width, height, step=step, units=units, workers=1)
+    failed = 0
+    for options in nests:
+        options = [ nest for nest in options
+                    if nest.dx <= width - 2*step and nest.dy <= height - 2*step ]
+        if len(options) == 0 or l.place(options, speed) == None:
+            failed += 1
+    return (len(l.sheets), failed)
+
+# pick the sheet stock size for nesting the parts (in placement
+# order.)  stock is a list of (width, height, cost per sheet), each
+# size is nested in parallel and the one with the lowest total cost
+# wins (or the least total sheet area when the costs aren't all known,
+# fewest sheets on a tie.)  The nest parts are prepared once for all
+# the sizes.  With workers > 1 the sizes are nested in that many
+# processes.  The choice is kept in the nesting cache if there is one.
+# Returns (width, height).
+def choose_stock(parts, stock, speed, step=None, units="in", workers=1,
+                 cache_dir=None):
+    width = max( [ s[0] for s in stock ] )
+    height = max( [ s[1] for s in stock ] )
+    l = layout.Layout("", width, height, step=step, units=units, workers=1)
+    if cache_dir != None:
+        key = l.cache_key(parts, speed, extra=("stock", stock))
+        best = nestcache.load(cache_dir, key)
+        if best != None:
+            print "Using sheet stock " + str(best[0]) + "x" + str(best[1]) \
+                + units + " (from the nesting cache)"
+            return tuple(best)
+    nests = [ l.make_nest_parts(part, speed) for part in parts ]
+    data = (l.step, units, speed, nests)
+    sizes = [ (s[0], s[1]) for s in stock ]
+    if workers > 1 and len(sizes) > 1:
+        pool = multiprocessing.Pool(min(workers, len(sizes)),
+                                    initializer=set_job, initargs=(data,))
+        try:
+            results = pool.map(evaluate_stock, sizes)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        set_job(data)
+        results = map(evaluate_stock, sizes)
+
+    priced = len( [ s for s in stock if s[2] > 0.0 ] ) == len(stock)
+    best = None
+    best_score = None
+    for (w, h, cost), (sheets, failed) in zip(stock, results):
+        if priced:
+            total = sheets * cost
+        else:
+            total = sheets * w * h
+        print "Sheet stock " + str(w) + "x" + str(h) + units + ":", sheets, \
+            "sheets, total", ("cost" if priced else "area"), total, \
+            ("(" + str(failed) + " parts don't fit)" if failed else "")
+        score = (failed, total, sheets)
+        if best_score == None or score < best_score:
+            best = (w, h)
+            best_score = score
+    print "Using sheet stock " + str(best[0]) + "x" + str(best[1]) + units
+    if cache_dir != None:
+        nestcache.store(cache_dir, key, best)
+    return best
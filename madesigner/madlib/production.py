@@ -0,0 +1,103 @@
+# production.py - nest the parts for a production run of kits
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# A production run is one or more designs, each with a number of kits
+# to cut.  Every rib of every kit is nested in a single pass onto one
+# shared set of sheets (identical parts reuse their nesting work, see
+# layout.py.)
+
+import multiprocessing
+import sys
+import os.path
+
+from props import PropertyNode
+import props_json
+
+from builder import Builder
+from structure import layout_parts_sheets_shared
+
+
+# designs: list of (filename, copies).  The sheet size (or sheet stock
+# catalogue) and units come from the first design unless given.
+# workers: number of processes for the nesting searches.
+def production_run(designs, dirname, nest_speed="fast", airfoil_resample=25,
+                   circle_points=8, sheet_w=None, sheet_h=None,
+                   nest_budget=None, workers=1):
+    structures = []
+    counts = []
+    units = None
+    stock = None
+    for (filename, copies) in designs:
+        design = PropertyNode()
+        if not props_json.load(filename, design):
+            print filename + ": parse error:\n" + str(sys.exc_info()[1])
+            return False
+        build = Builder(design, dirname=dirname,
+                        airfoil_resample=airfoil_resample,
+                        circle_points=circle_points, nest_speed=nest_speed,
+                        build=False)
+        build.parse_design()
+        if units == None:
+            units = build.units
+            if sheet_w == None and sheet_h == None:
+                stock = build.sheet_stock
+            if sheet_w == None:
+                sheet_w = build.sheet_w
+            if sheet_h == None:
+                sheet_h = build.sheet_h
+        elif build.units != units:
+            print "ERROR: " + filename + " uses units '" + build.units \
+                + "', the production run uses '" + units + "'"
+            return False
+        if len(designs) > 1:
+            # tell the parts of different designs apart
+            root, ext = os.path.splitext(os.path.basename(filename))
+            for wing in build.wings:
+                wing.name = root + " " + wing.name
+        structures += build.wings
+        counts += [copies] * len(build.wings)
+
+    if len(structures):
+        layout_parts_sheets_shared( structures,
+                                    os.path.join(dirname, "production-sheet"),
+                                    sheet_w, sheet_h, units=units,
+                                    speed=nest_speed, counts=counts,
+                                    budget=nest_budget, stock=stock,
+                                    cache_dir=os.path.join(dirname,
+                                                           "nest-cache"),
+                                    workers=workers )
+    return True
+
+def usage():
+    print "Usage: " + sys.argv[0] + " [--speed fast|medium|convex|nice|nfp|holes] [--budget seconds] design.mad[:copies] ..."
+
+def main():
+    speed = "fast"
+    budget = None
+    args = sys.argv[1:]
+    while len(args) >= 2 and args[0] in ("--speed", "--budget"):
+        if args[0] == "--speed":
+            speed = args[1]
+        else:
+            budget = float(args[1])
+        args = args[2:]
+    if len(args) == 0:
+        usage()
+        return
+    designs = []
+    for arg in args:
+        copies = 1
+        filename = arg
+        head, sep, tail = arg.rpartition(':')
+        if sep and tail.isdigit():
+            filename = head
+            copies = int(tail)
+        designs.append( (filename, copies) )
+    production_run(designs, os.getcwd(), nest_speed=speed, nest_budget=budget,
+                   workers=multiprocessing.cpu_count())
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,161 @@
+# raster.py - occupancy bitmaps for sheet nesting
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# Shapes are rasterized conservatively: a cell is marked if any part
+# of the shape touches it.  So if two bitmaps don't share a marked
+# cell the shapes can't overlap either, and all the collision free
+# placements of a part on a sheet can be found with a single
+# correlation of the part bitmap against the sheet bitmap.
+
+import math
+import numpy as np
+import Polygon
+
+
+# rasterize a Polygon on a grid of square 'cell' size cells aligned
+# with the origin.  Returns (bitmap, i0, j0) where bitmap[i][j] is
+# the cell at column i0+i and row j0+j.  The cells that lie completely
+# inside a hole of the polygon are left clear.
+def rasterize(poly, cell):
+    (bitmap, i0, j0) = rasterize_filled(poly, cell)
+    for k, c in enumerate(poly):
+        if not poly.isHole(k):
+            continue
+        hole = Polygon.Polygon(c)
+        (inside, a0, b0) = interior(hole, cell)
+        paste(bitmap, i0, j0, inside, a0, b0, False)
+        # parts of the polygon sitting inside the hole
+        for m, d in enumerate(poly):
+            if not poly.isHole(m) and hole.isInside(d[0][0], d[0][1]):
+                (shape, a0, b0) = rasterize_filled(Polygon.Polygon(d), cell)
+                paste(bitmap, i0, j0, shape, a0, b0, True)
+    return (bitmap, i0, j0)
+
+# set the cells of a bitmap (origin i0, j0) that are marked in a shape
+# bitmap (origin a0, b0) to value
+def paste(bitmap, i0, j0, shape, a0, b0, value):
+    (nx, ny) = bitmap.shape
+    (w, h) = shape.shape
+    u0 = max(a0, i0)
+    v0 = max(b0, j0)
+    u1 = min(a0 + w, i0 + nx)
+    v1 = min(b0 + h, j0 + ny)
+    if u1 > u0 and v1 > v0:
+        area = bitmap[u0-i0:u1-i0, v0-j0:v1-j0]
+        area[shape[u0-a0:u1-a0, v0-b0:v1-b0]] = value
+
+# rasterize a Polygon as if it had no holes
+def rasterize_filled(poly, cell):
+    if len(poly) == 0:
+        return (np.zeros( (0, 0), dtype=bool ), 0, 0)
+    xmin, xmax, ymin, ymax = poly.boundingBox()
+    i0 = int(math.floor(xmin / cell))
+    j0 = int(math.floor(ymin / cell))
+    i1 = int(math.ceil(xmax / cell))
+    j1 = int(math.ceil(ymax / cell))
+    bitmap = np.zeros( (i1 - i0, j1 - j0), dtype=bool )
+    pad = cell
+    for j in range(j0, j1):
+        band = Polygon.Polygon( [ (xmin - pad, j*cell), (xmax + pad, j*cell),
+                                  (xmax + pad, (j+1)*cell),
+                                  (xmin - pad, (j+1)*cell) ] )
+        piece = poly & band
+        for k, c in enumerate(piece):
+            if piece.isHole(k):
+                continue
+            xs = [ pt[0] for pt in c ]
+            a = int(math.floor(min(xs) / cell)) - i0
+            b = int(math.ceil(max(xs) / cell)) - i0
+            bitmap[max(a, 0):b, j - j0] = True
+    return (bitmap, i0, j0)
+
+# mark the cells covered by a polygon in a sheet bitmap
+def stamp(bitmap, poly, cell):
+    (shape, i0, j0) = rasterize(poly, cell)
+    paste(bitmap, 0, 0, shape, i0, j0, True)
+
+# the fourier transform of a sheet bitmap (see overlap_counts)
+def spectrum(sheet):
+    return np.fft.rfft2(sheet.astype(float))
+
+# correlate a part bitmap against a sheet bitmap.  Returns an array
+# with the number of overlapping cells for each offset (u, v) of the
+# part bitmap inside the sheet bitmap (u in 0..nx-w, v in 0..ny-h.)
+# The transforms of the sheet and the part (padded to the sheet size)
+# can be passed in when they are reused.
+def overlap_counts(sheet, part, fs=None, fp=None):
+    (nx, ny) = sheet.shape
+    (w, h) = part.shape
+    if w > nx or h > ny:
+        return np.zeros( (0, 0) )
+    if not sheet.any():
+        return np.zeros( (nx - w + 1, ny - h + 1) )
+    if fs is None:
+        fs = spectrum(sheet)
+    if fp is None:
+        fp = spectrum(np.pad(part, ( (0, nx - w), (0, ny - h) ), 'constant'))
+    corr = np.fft.irfft2(fs * np.conj(fp), s=sheet.shape)
+    return corr[:nx - w + 1, :ny - h + 1]
+
+# the cells that lie completely inside a polygon: (bitmap, i0, j0)
+# like rasterize().  These are the cells not touched by the area
+# around the polygon.
+def interior(poly, cell):
+    if len(poly) == 0:
+        return (np.zeros( (0, 0), dtype=bool ), 0, 0)
+    xmin, xmax, ymin, ymax = poly.boundingBox()
+    pad = cell
+    frame = Polygon.Polygon( [ (xmin - pad, ymin - pad), (xmax + pad, ymin - pad),
+                               (xmax + pad, ymax + pad), (xmin - pad, ymax + pad) ] )
+    (bitmap, i0, j0) = rasterize_filled(frame - poly, cell)
+    return (~bitmap, i0, j0)
+
+# length of the longest run of set cells along the first axis of a
+# bitmap
+def longest_run(bitmap):
+    if not bitmap.any():
+        return 0
+    count = np.cumsum(bitmap, axis=0)
+    base = np.maximum.accumulate(np.where(bitmap, 0, count), axis=0)
+    return int(np.max(count - base))
+
+# the (w, h) size in cells of the largest area rectangle of set cells
+# in a bitmap
+def largest_rectangle(bitmap):
+    (nx, ny) = bitmap.shape
+    if nx < ny:
+        # grow along the shorter side
+        (h, w) = largest_rectangle(bitmap.T)
+        return (w, h)
+    best = (0, 0)
+    rows = bitmap
+    for h in range(1, ny + 1):
+        if h > 1:
+            # cells that start a run of h set cells upwards
+            rows = rows[:,:-1] & bitmap[:,h-1:]
+        w = longest_run(rows)
+        if w == 0:
+            break
+        if w * h > best[0] * best[1]:
+            best = (w, h)
+    return best
+
+# summed area table of a bitmap (one row and column of zeros in front)
+def summed_area(bitmap):
+    (nx, ny) = bitmap.shape
+    table = np.zeros( (nx + 1, ny + 1), dtype=np.int32 )
+    table[1:,1:] = np.cumsum(np.cumsum(bitmap, axis=0, dtype=np.int32), axis=1)
+    return table
+
+# true if a w x h window of clear cells exists in the bitmap that the
+# summed area table was made from
+def has_clear_window(table, w, h):
+    (nx, ny) = (table.shape[0] - 1, table.shape[1] - 1)
+    if w > nx or h > ny:
+        return False
+    if w <= 0 or h <= 0:
+        return True
+    counts = table[w:,h:] - table[:-w,h:] - table[w:,:-h] + table[:-w,:-h]
+    return bool((counts == 0).any())
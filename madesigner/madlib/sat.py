@@ -0,0 +1,96 @@
+# sat.py - separating axis overlap tests for convex pieces
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# Two convex pieces don't overlap if there is an axis (one of the edge
+# normals of either piece) along which their projections don't
+# overlap.  Projections onto a fixed axis just slide when a piece is
+# moved, so the test for a whole batch of positions of a part against
+# a set of fixed pieces is a few array operations.
+
+import numpy as np
+
+
+# vertices (n, k, 2) and unit edge normals (n, k, 2) of a list of
+# prepared convex pieces (see nfp.prepare_piece), padded to the same
+# length by repeating the last vertex and normal.  (Degenerate edges
+# just repeat a normal.)
+def piece_arrays(pieces):
+    k = max( [ len(edges) for (start, edges, angles) in pieces ] )
+    verts = np.zeros( (len(pieces), k, 2) )
+    normals = np.zeros( (len(pieces), k, 2) )
+    for i, (start, edges, angles) in enumerate(pieces):
+        n = len(edges)
+        v = start + np.concatenate( (np.zeros( (1, 2) ),
+                                     np.cumsum(edges[:-1], axis=0)) )
+        verts[i,:n] = v
+        verts[i,n:] = v[-1]
+        lengths = np.hypot(edges[:,0], edges[:,1])
+        keep = lengths > 1e-9 * max(np.max(lengths), 1e-300)
+        e = edges[keep] / lengths[keep][:,np.newaxis]
+        m = len(e)
+        normals[i,:m,0] = e[:,1]
+        normals[i,:m,1] = -e[:,0]
+        normals[i,m:] = normals[i,m-1]
+    return (verts, normals)
+
+# test a moving set of pieces (verts, normals) at each of the
+# positions (m, 2) against a fixed set of pieces.  Returns a bool array
+# (m,) that is True where some pair of pieces overlaps (touching is
+# fine.)  Only the pairs of pieces whose bounding boxes meet at a
+# position are tested there: on a sheet most neighbor pieces are out
+# of reach, so this leaves a few pairs per position.  Each of those
+# pairs is projected once for the whole batch, a position just
+# shifts the projections.
+def blocked(moving, fixed, positions, eps=1e-9):
+    (av, an) = moving
+    (bv, bn) = fixed
+    result = np.zeros(len(positions), dtype=bool)
+    # (position, moving piece, fixed piece) triples whose boxes meet
+    amin = av.min(axis=1)
+    amax = av.max(axis=1)
+    bmin = bv.min(axis=1)
+    bmax = bv.max(axis=1)
+    lo = (bmin[np.newaxis] - amax[:,np.newaxis])[np.newaxis] \
+        < positions[:,np.newaxis,np.newaxis]
+    hi = (bmax[np.newaxis] - amin[:,np.newaxis])[np.newaxis] \
+        > positions[:,np.newaxis,np.newaxis]
+    (im, ia, ib) = np.nonzero(np.all(lo & hi, axis=3))
+    if len(im) == 0:
+        return result
+    # project each pair of pieces that is near at some position onto
+    # its axes: (pairs, axes, 2)
+    (pairs, ip) = np.unique(ia * len(bv) + ib, return_inverse=True)
+    pa_index = pairs // len(bv)
+    pb_index = pairs % len(bv)
+    axes = np.concatenate( (an[pa_index], bn[pb_index]), axis=1 )
+    pa = np.einsum('pkd,pad->pak', av[pa_index], axes)
+    pb = np.einsum('pkd,pad->pak', bv[pb_index], axes)
+    # the pieces overlap for a shift d (along an axis) in lo < d < hi
+    lo = pb.min(axis=2) - pa.max(axis=2)
+    hi = pb.max(axis=2) - pa.min(axis=2)
+    scale = eps * (1.0 + np.abs(lo) + np.abs(hi))
+    lo += scale
+    hi -= scale
+    d = np.einsum('nd,nad->na', positions[im], axes[ip])
+    overlap = np.all( (d > lo[ip]) & (d < hi[ip]), axis=1 )
+    result[im[overlap]] = True
+    return result
+
+# join several (verts, normals) piece sets into one
+def combine(sets):
+    k = max( [ verts.shape[1] for (verts, normals) in sets ] )
+    all_verts = []
+    all_normals = []
+    for (verts, normals) in sets:
+        pad = k - verts.shape[1]
+        if pad:
+            verts = np.concatenate( (verts, np.repeat(verts[:,-1:], pad, axis=1)),
+                                    axis=1 )
+            normals = np.concatenate( (normals,
+                                       np.repeat(normals[:,-1:], pad, axis=1)),
+                                      axis=1 )
+        all_verts.append(verts)
+        all_normals.append(normals)
+    return (np.concatenate(all_verts), np.concatenate(all_normals))
@@ -18,6 +18,7 @@ import airfoil
 import contour
 import freecad
 import layout
+import optimize
 
 # path to your FreeCAD.so or FreeCAD.dll file
 FREECADPATH = '/usr/lib64/freecad/lib'
@@ -238,6 +239,77 @@ class Rib:
         return hull.area()
 
 
+# nest the ribs of several structures in one pass onto a shared set of
+# sheets.  The ribs of all the structures are sorted by size together
+# and placed largest first.  When more than one structure shares the
+# sheets the rib labels are prefixed with the structure name so the
+# parts can still be told apart.  counts is an optional list with the
+# number of copies of each structure to nest (i.e. for a production
+# run of several kits.)  With a time budget (seconds) the placement
+# order and orientations are optimized for that long first.  stock is
+# an optional catalogue of sheet sizes [ (width, height, cost) ] to
+# pick the cheapest one from (instead of width x height.)  With a
+# cache_dir the nesting results are kept on disk and an unchanged set
+# of parts is drawn without nesting it again.  workers > 1 runs the
+# expensive searches in that many processes (see layout.Layout.)
+# Returns the layout.
+def layout_parts_sheets_shared(structures, basename, width, height,
+                               step=None, units="in", speed="fast",
+                               counts=None, budget=None, stock=None,
+                               cache_dir=None, workers=1):
+    if counts == None:
+        counts = [1] * len(structures)
+    # sort by size (ascending), then place in reverse order (largest first)
+    sorted_list = []
+    for s, count in zip(structures, counts):
+        for rib in s.right_ribs + s.left_ribs:
+            area = rib.hull_area()
+            for i in range(count):
+                sorted_list.append( (area, s, rib) )
+    print "placement_list:", [ (area, rib) for (area, s, rib) in sorted_list ]
+    sorted_list = sorted(sorted_list, key=lambda fields: fields[0])
+    # place the ribs (identical ribs are nested together)
+    ribs = []
+    parts = []
+    for (area, s, rib) in reversed(sorted_list):
+        part = rib.contour
+        if len(structures) > 1:
+            part = copy.copy(rib.contour)
+            part.labels = []
+            for label in rib.contour.labels:
+                part.labels.append( label[:4] + (s.name + " " + label[4],) )
+        ribs.append(rib)
+        parts.append(part)
+    if stock:
+        (width, height) = optimize.choose_stock(parts, stock, speed,
+                                                step=step, units=units,
+                                                workers=workers,
+                                                cache_dir=cache_dir)
+    l = layout.Layout( basename, width, height, step=step, units=units,
+                       workers=workers, cache_dir=cache_dir )
+    try:
+        placed = l.draw_cached_cut_line(parts, speed, extra=budget)
+        if placed == None:
+            if budget:
+                placed = [ False ] * len(parts)
+                plan = optimize.optimize_layout(l, parts, speed, budget)
+                for (i, angles) in plan:
+                    placed[i] = l.draw_part_cut_line(parts[i], speed, angles)
+            else:
+                placed = l.draw_parts_cut_line(parts, speed=speed)
+            l.store_cached(parts, speed, extra=budget)
+    finally:
+        l.close()
+    # with counts a rib is in the list once per copy, it only counts as
+    # placed if all its copies are
+    for rib in ribs:
+        rib.placed = True
+    for rib, flag in zip(ribs, placed):
+        rib.placed = rib.placed and flag
+    l.save()
+    return l
+
+
 class Structure:
 
     def __init__(self, basename):
@@ -545,6 +617,9 @@ class Structure:
         lat_dist = rib.pos[0]
         chord = rib.contour.saved_bounds[1][0] - rib.contour.saved_bounds[0][0]
 
+        # queue up the cuts and subtract them all at once at the end
+        rib.contour.begin_cuts()
+
         # trailing edge cutout (first!)
         for te in self.trailing_edges:
             if self.match_station(te.start_station, te.end_station, lat_dist):
@@ -638,21 +713,14 @@ class Structure:
                 if rib.side == tab.side:
                     shape = rib.contour.add_build_tab(tab.surf, tab.pos, tab.xsize, tab.ypad)
 
+        rib.contour.end_cuts()
+
     def layout_parts_sheets(self, width, height, step=None, units="in",
-                            speed="fast"):
-        l = layout.Layout( self.basename + self.name + '-sheet', width, height, step=step, units=units )
-        # sort by size (ascending), then place in reverse order (largest first)
-        sorted_list = []
-        for rib in self.right_ribs:
-            sorted_list.append( (rib.hull_area(), rib) )
-        for rib in self.left_ribs:
-            sorted_list.append( (rib.hull_area(), rib) )
-        print "placement_list:", sorted_list
-        sorted_list = sorted(sorted_list, key=lambda fields: fields[0])
-        # place the ribs
-        for (area, rib) in reversed(sorted_list):
-            rib.placed = l.draw_part_cut_line(rib.contour, speed=speed)
-        l.save()
+                            speed="fast", budget=None, cache_dir=None):
+        layout_parts_sheets_shared( [self], self.basename + self.name + '-sheet',
+                                    width, height, step=step, units=units,
+                                    speed=speed, budget=budget,
+                                    cache_dir=cache_dir )
 
     def layout_parts_templates(self, width, height, step=None, speed="fast"):
         l = layout.Layout( self.basename + '-template', width, height, step )
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+# arc-check.py - check the arc length queries of a Contour
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# Measures distances along two straight surface curves (where the
+# answer is known) with Contour.arc_distance() and checks that every
+# arc query rejects an unknown surface name.  Exits non-zero if anything fails.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.split(os.path.abspath(__file__))[0]+'/../madesigner/madlib'))
+
+import contour
+
+# distances smaller than this are rounding
+tolerance = 1e-9
+
+
+def main():
+    c = contour.Contour()
+    # 3-4-5 steps on the top, flat on the bottom
+    c.top = [ (0.0, 0.0), (3.0, 4.0), (6.0, 8.0) ]
+    c.bottom = [ (0.0, 0.0), (6.0, 0.0) ]
+
+    checks = [ ("top", 0.0, 6.0, 10.0),
+               ("top", 0.0, 3.0, 5.0),
+               ("top", 3.0, 0.0, -5.0),
+               ("top", 1.5, 4.5, 5.0),
+               ("top", -1.0, 7.0, 10.0),   # clamped to the curve ends
+               ("bottom", 1.0, 4.0, 3.0) ]
+    failed = False
+    for (surf, x0, x1, expect) in checks:
+        dist = c.arc_distance(surf, x0, x1)
+        if abs(dist - expect) > tolerance:
+            failed = True
+            print "FAILED %s %g..%g: %g, expected %g" % (surf, x0, x1,
+                                                         dist, expect)
+    queries = [ ("arc_length", lambda: c.arc_length("middle")),
+                ("arc_position", lambda: c.arc_position("middle", 1.0)),
+                ("arc_distance", lambda: c.arc_distance("middle", 0.0, 1.0)),
+                ("arc_xpos", lambda: c.arc_xpos("middle", 0.0, 1.0)) ]
+    for (name, query) in queries:
+        try:
+            query()
+            failed = True
+            print "FAILED " + name + " accepted an unknown surface curve"
+        except ValueError:
+            pass
+    if failed:
+        sys.exit(1)
+    print "ok"
+
+if __name__ == '__main__':
+    main()
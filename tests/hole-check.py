@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+# hole-check.py - check that the shaped lightening holes build
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# Builds the ribs of the sport-flyer design.  Its shaped holes run out
+# toward the tip where the section is too thin to fit them with the
+# requested material width, which used to crash carve_shaped_hole().
+# Checks that the build finishes and that the ribs with room for a
+# hole got one.  Exits non-zero if anything fails.
+
+import os
+import sys
+
+import testutil
+
+testdir = os.path.split(os.path.abspath(__file__))[0]
+example = os.path.join(testdir, "sport-flyer.mad")
+
+
+def main():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        build = testutil.load_design(example)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    # a rib with a hole carved out has more than the one outline
+    holes = 0
+    for wing in build.wings:
+        for rib in wing.right_ribs + wing.left_ribs:
+            if len(rib.contour.poly) > 1:
+                holes += 1
+    if holes == 0:
+        print "FAILED: no rib has a hole"
+        sys.exit(1)
+    print "ok (%d ribs with holes)" % holes
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# nest-benchmark.py - compare the sheet nesting speeds
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# Builds the ribs of the bundled example designs, then nests each rib
+# set with every nesting speed and reports the wall time, the number of
+# sheets and the utilization (part area / sheet area) of each sheet.
+# The results are written as JSON so runs can be compared for speed or
+# packing regressions.  --copies nests several kits of each design at
+# once (for a fuller sheet.)  The corpus is the ePlane example plus
+# .mad ports of the sport-flyer, vintage-glider and ukulalela scripts
+# in this directory (the scripts use an older version of the wing API.)
+# A design that fails to build is an error, not a skipped entry.
+#
+#   nest-benchmark.py [--speed name ...] [--copies n] [--output results.json]
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import testutil
+
+import structure
+
+testdir = os.path.split(os.path.abspath(__file__))[0]
+speeds = [ "fast", "medium", "convex", "nice", "nfp", "holes" ]
+examples = [ os.path.join(testdir, "../madesigner/madgui/examples/ePlane.mad"),
+             os.path.join(testdir, "sport-flyer.mad"),
+             os.path.join(testdir, "vintage-glider.mad"),
+             os.path.join(testdir, "ukulalela.mad") ]
+
+
+# the ribs of a .mad design: (name, structures, width, height, units)
+def load_design(filename):
+    build = testutil.load_design(filename)
+    root, ext = os.path.splitext(os.path.basename(filename))
+    return (root, build.wings, build.sheet_w, build.sheet_h, build.units)
+
+# nest the ribs of a design (copies kits) with one speed and measure
+# the result
+def run(design, speed, copies, outdir):
+    (name, structures, width, height, units) = design
+    start = time.time()
+    l = structure.layout_parts_sheets_shared( structures,
+                                              os.path.join(outdir, name),
+                                              width, height, units=units,
+                                              speed=speed,
+                                              counts=[copies] * len(structures) )
+    elapsed = time.time() - start
+    parts = 0
+    for s in structures:
+        parts += len(s.right_ribs + s.left_ribs) * copies
+    placed = 0
+    utilization = []
+    for sheet in l.sheets:
+        area = 0.0
+        for (nest, pos) in sheet.placed:
+            area += nest.poly.area()
+            placed += 1
+        utilization.append( area / (sheet.width * sheet.height) )
+    return { 'design': name, 'speed': speed, 'units': units, 'copies': copies,
+             'sheet_width': width, 'sheet_height': height,
+             'parts': parts, 'placed': placed, 'seconds': elapsed,
+             'sheets': len(l.sheets), 'utilization': utilization }
+
+def usage():
+    print "Usage: " + sys.argv[0] + " [--speed name ...] [--copies n] [--output results.json]"
+
+def main():
+    run_speeds = []
+    copies = 1
+    output = "nest-benchmark.json"
+    args = sys.argv[1:]
+    while len(args) >= 2 and args[0] in ("--speed", "--copies", "--output"):
+        if args[0] == "--speed":
+            run_speeds.append(args[1])
+        elif args[0] == "--copies":
+            copies = int(args[1])
+        else:
+            output = args[1]
+        args = args[2:]
+    if len(args):
+        usage()
+        return
+    if len(run_speeds) == 0:
+        run_speeds = speeds
+
+    # build the rib sets once (the build output isn't interesting here)
+    designs = []
+    errors = {}
+    stdout = sys.stdout
+    for filename in examples:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            designs.append( load_design(filename) )
+        except Exception as e:
+            errors[os.path.basename(filename)] = str(e)
+        sys.stdout.close()
+        sys.stdout = stdout
+    if len(errors):
+        for name in sorted(errors):
+            print "error building " + name + ": " + errors[name]
+        sys.exit(1)
+
+    outdir = tempfile.mkdtemp()
+    results = []
+    for design in designs:
+        for speed in run_speeds:
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                result = run(design, speed, copies, outdir)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            results.append(result)
+            print "%-16s %-7s %3d/%3d parts %2d sheets %8.2fs  utilization %s" \
+                % (result['design'], speed, result['placed'],
+                   result['parts'], result['sheets'], result['seconds'],
+                   " ".join( [ "%.2f" % u for u in result['utilization'] ] ))
+    shutil.rmtree(outdir)
+
+    f = open(output, 'w')
+    json.dump( { 'results': results }, f, indent=2, sort_keys=True )
+    f.close()
+    print "wrote " + output
+
+if __name__ == '__main__':
+    main()
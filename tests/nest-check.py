@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# nest-check.py - check the sheet nesting results for every speed
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+# Nests the ribs of the ePlane example with every nesting speed and
+# checks that every rib was placed, that no two collision hulls on a
+# sheet overlap and that no part hangs off its sheet.  Then nests each
+# speed again through a nesting cache and checks that the second run
+# is drawn from the cache, to the same positions, and passes the same
+# checks.  Exits non-zero if anything fails.
+#
+#   nest-check.py [--speed name ...] [--copies n]
+
+import math
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+
+import testutil
+
+import Polygon
+
+import structure
+
+testdir = os.path.split(os.path.abspath(__file__))[0]
+speeds = [ "fast", "medium", "convex", "nice", "nfp", "holes" ]
+example = os.path.join(testdir, "../madesigner/madgui/examples/ePlane.mad")
+
+# overlaps and overhangs smaller than this (in square units) are
+# rounding
+tolerance = 1e-6
+
+
+# nest the ribs with one speed, return the layout and what it printed
+def nest(build, speed, copies, basename, cache_dir=None):
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        l = structure.layout_parts_sheets_shared( build.wings, basename,
+                                                  build.sheet_w,
+                                                  build.sheet_h,
+                                                  units=build.units,
+                                                  speed=speed,
+                                                  counts=[copies] * len(build.wings),
+                                                  cache_dir=cache_dir )
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    return (l, output)
+
+# the problems with a layout (a list of messages)
+def check_layout(build, l, copies):
+    errors = []
+    for wing in build.wings:
+        for rib in wing.right_ribs + wing.left_ribs:
+            if not rib.placed:
+                errors.append("rib not placed")
+    count = 0
+    for (i, sheet) in enumerate(l.sheets):
+        area = Polygon.Polygon( [ (0.0, 0.0), (sheet.width, 0.0),
+                                  (sheet.width, sheet.height),
+                                  (0.0, sheet.height) ] )
+        hulls = []
+        for (nest, pos) in sheet.placed:
+            count += 1
+            part = Polygon.Polygon(nest.poly)
+            if nest.angle != 0.0:
+                part.rotate(math.radians(nest.angle), 0.0, 0.0)
+            part.shift(pos[0], pos[1])
+            if (part - area).area() > tolerance:
+                errors.append("sheet %d: part off the sheet at %s" % (i, str(pos)))
+            hull = Polygon.Polygon(nest.hull)
+            hull.shift(pos[0], pos[1])
+            hulls.append( (hull, pos) )
+        for a in range(len(hulls)):
+            for b in range(a + 1, len(hulls)):
+                if (hulls[a][0] & hulls[b][0]).area() > tolerance:
+                    errors.append("sheet %d: hulls at %s and %s overlap"
+                                  % (i, str(hulls[a][1]), str(hulls[b][1])))
+    parts = 0
+    for wing in build.wings:
+        parts += len(wing.right_ribs + wing.left_ribs) * copies
+    if count != parts:
+        errors.append("%d of %d parts on the sheets" % (count, parts))
+    return errors
+
+# where each part was drawn: (sheet, angle, x, y), sorted
+def drawn(l):
+    result = []
+    for (part, sheet, angle, pos) in l.drawn:
+        result.append( (l.sheets.index(sheet), float(angle) % 360.0,
+                        round(pos[0], 6), round(pos[1], 6)) )
+    return sorted(result)
+
+def usage():
+    print "Usage: " + sys.argv[0] + " [--speed name ...] [--copies n]"
+
+def main():
+    run_speeds = []
+    copies = 2
+    args = sys.argv[1:]
+    while len(args) >= 2 and args[0] in ("--speed", "--copies"):
+        if args[0] == "--speed":
+            run_speeds.append(args[1])
+        else:
+            copies = int(args[1])
+        args = args[2:]
+    if len(args):
+        usage()
+        sys.exit(2)
+    if len(run_speeds) == 0:
+        run_speeds = speeds
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        build = testutil.load_design(example)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    outdir = tempfile.mkdtemp()
+    failed = False
+    try:
+        for speed in run_speeds:
+            cache_dir = os.path.join(outdir, "cache-" + speed)
+            basename = os.path.join(outdir, speed)
+            (l, output) = nest(build, speed, copies, basename, cache_dir)
+            errors = check_layout(build, l, copies)
+            (cached, output) = nest(build, speed, copies, basename + "-cached",
+                                    cache_dir)
+            if "from the nesting cache" not in output:
+                errors.append("second run not drawn from the cache")
+            if drawn(cached) != drawn(l):
+                errors.append("cached positions differ from the nested ones")
+            errors += [ "cached: " + e for e in check_layout(build, cached, copies) ]
+            if len(errors):
+                failed = True
+                print "%-7s FAILED" % speed
+                for e in errors:
+                    print "  " + e
+            else:
+                print "%-7s ok (%d sheets)" % (speed, len(l.sheets))
+    finally:
+        shutil.rmtree(outdir)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+# testutil.py - shared setup for the check and benchmark scripts
+#
+# Copyright (C) 2013-2017 - Curtis Olson, curtolson@flightgear.org
+# http://madesigner.flightgear.org
+
+import os
+import sys
+import tempfile
+
+# the airfoil data is loaded as a resource of the madlib package, the
+# modules themselves import each other by plain name
+testdir = os.path.split(os.path.abspath(__file__))[0]
+sys.path.insert(0, os.path.abspath(testdir + '/../madesigner'))
+sys.path.insert(0, os.path.abspath(testdir + '/../madesigner/madlib'))
+
+from props import PropertyNode
+import props_json
+
+from builder import Builder
+
+
+# parse a design and build its wings (no sheets, plans or model.)
+# Returns the Builder.
+def load_design(filename):
+    design = PropertyNode()
+    if not props_json.load(filename, design):
+        raise Exception("parse error")
+    build = Builder(design, dirname=tempfile.gettempdir() + '/', build=False)
+    build.parse_design()
+    return build